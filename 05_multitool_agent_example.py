@@ -1,10 +1,16 @@
 import streamlit as st
 from agents.agent import Agent
+from agents.memory import MemoryStore, RelevantMemories
 
-from agents.tools.fs import SearchDirectory, ListDirectory, ViewFile
+from agents.tools.fs import SearchDirectory, ListDirectory, ViewFile, SemanticSearch, GrepFiles
 from agents.tools.llm import QueryFile
 from agents.tools.github import GetUserInfo, GetRepositories, CloneRepo, CreateIssue, GetIssueDetails, GetIssues
 
+# ./memory has a single writer, every browser session shares this instance
+@st.cache_resource
+def get_memory():
+    return RelevantMemories(store=MemoryStore("./memory"))
+
 if "agent" not in st.session_state:
     st.session_state["agent"] = Agent(
         [
@@ -17,8 +23,11 @@ if "agent" not in st.session_state:
             ListDirectory(),
             SearchDirectory(),
             ViewFile(),
+            SemanticSearch(),
+            GrepFiles(),
             QueryFile(),
-        ]
+        ],
+        memory=get_memory()
     )
 
 st.title("🤖 Multi Tool Agent Example")
@@ -33,8 +42,17 @@ if goal := st.chat_input():
     st.session_state.messages.append({"role": "user", "content": goal})
     st.chat_message("user").write(goal)
     agent = st.session_state["agent"]
-    
-    final_answer = agent.execute_chain_of_thought(goal)
 
-    st.session_state.messages.append({"role": "assistant", "content": final_answer})
-    st.chat_message("assistant").write(final_answer)
\ No newline at end of file
+    with st.chat_message("assistant"):
+        status = st.status("Thinking...")
+        placeholder = st.empty()
+        final_answer = ""
+        for event in agent.execute_chain_of_thought_stream(goal):
+            if event["step"] == "Final Answer":
+                final_answer = event.get("content", final_answer + event.get("delta", ""))
+                placeholder.markdown(final_answer)
+            elif "content" in event and event["step"] != "Goal":
+                status.write(f"**{event['step']}:** {event['content']}")
+        status.update(label="Done", state="complete")
+
+    st.session_state.messages.append({"role": "assistant", "content": final_answer})
\ No newline at end of file
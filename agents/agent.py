@@ -1,9 +1,16 @@
 # agent.py
+import contextvars
+import copy
 import json
+import os
+import threading
 import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
 from agents.memory import LastMemories, LastTokens, RelevantMemories
-from llm import generate_text, generate_text_with_function_call, gpt4_model, gpt35_model, gpt35_16k_model
-from utils import Logger
+from agents.scratchpad import Scratchpad
+from llm import generate_text, generate_text_with_function_call, count_tokens, count_tokens_many, count_message_tokens, gpt4_model, router, track_usage
+from utils import Logger, span, traced
 
 SYSTEM_MESSAGE = """You are a helpful assistant. You are trying to solve the Goal. Keep track of your thought process in the [SCRATCHPAD], use the following format to record your thoughts:
 
@@ -20,84 +27,258 @@ Final Answer: the final answer to the original input question.
 THINK_INSTRUCTIONS = """You are currently in the 'Thought' Step. 
 Based on the thought process in the [SCRATCHPAD], think about the steps to resolve the Goal, consider the available [TOOLS]. Explain your reasoning and declare the tool to use at the end. Answer in one or two sentences."""
 
+FUSED_INSTRUCTIONS = """You are currently in the 'Thought' and 'Action' Steps.
+Based on the thought process in the [SCRATCHPAD], think about the steps to resolve the Goal and call the function of the tool to use. Write your reasoning in one or two sentences in the 'thought' argument of the function."""
+
 FINAL_ANSWER_INSTRUCTIONS = """You are currently in the 'Final Answer' Step.
 Based only in the thought process and results in the [SCRATCHPAD], create a highly detailed and accurate answer to solve the Goal. You can use Markdown format. Be clear and concise."""
 
+PARALLEL_TOOLS_SCHEMA = {
+    "name": "parallel_tools",
+    "description": "Use this tool to run several tools at the same time when they are independent, i.e. no call needs the result of another one.",
+    "parameters": {
+        "type": "object",
+        "properties": {
+            "tool_calls": {
+                "type": "array",
+                "description": "The tools to run.",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "name": {"type": "string", "description": "The name of the tool function."},
+                        "arguments": {"type": "object", "description": "The arguments of the tool function."}
+                    },
+                    "required": ["name", "arguments"]
+                }
+            }
+        },
+        "required": ["tool_calls"]
+    }
+}
+
+# Tokens reserved for the final answer when choosing its model
+FINAL_ANSWER_TOKENS = 1000
+
+# Seconds a tool may run when it is executed in parallel and does not define its own timeout
+TOOL_TIMEOUT = 60
+
 class Agent:
-    def __init__(self, tools):
+    # fused=True asks for the thought and the tool call in a single function calling request
+    # instead of separate think and select_tool requests
+    # parallel_tools=True lets the model run several independent tools in one step
+    # scratchpad_tokens bounds the scratchpad sent in every prompt, see Scratchpad
+    # final_answer_model overrides the model chosen by the router for the final answer
+    def __init__(self, tools, memory=None, fused=False, parallel_tools=False, max_parallel_tools=8, scratchpad_tokens=3000, final_answer_model=None):
         self.tools = tools
-        self.log = Logger()
-        self.memory = RelevantMemories()
+        self.log = Logger(name="agent")
+        self.memory = memory or RelevantMemories()
+        self.fused = fused
+        self.parallel_tools = parallel_tools
+        self.executor = None
+        if parallel_tools:
+            self.executor = ThreadPoolExecutor(max_workers=max_parallel_tools, thread_name_prefix="tool")
+            # Stops the idle workers when the agent is closed or garbage collected
+            self.close_executor = weakref.finalize(self, self.executor.shutdown, wait=False, cancel_futures=True)
+        self.scratchpad_tokens = scratchpad_tokens
+        self.final_answer_model = final_answer_model
+        self.iteration_stats = []
+        self.prompt_prefix = None
+        self.llm_prompts = []
+        self.last_prompts = {}
+
+    # The tools schema and the system prompts built from it are the static prefix of every request.
+    # They are built once and reused byte for byte until the list of tools changes, so provider side
+    # prompt caching can hit.
+    def get_prompt_prefix(self):
+        signature = (tuple(id(tool) for tool in self.tools), self.parallel_tools)
+        if self.prompt_prefix is None or self.prompt_prefix["signature"] != signature:
+            final_answer_schema = {
+                "name": "final_answer", 
+                "description": "Use this tool when you have all necessary information to resolve the Goal or no additional tools are required.", 
+                "parameters": {"type": "object", "properties": {}, "required": []}
+            }
+            tools_schema = [tool.get_schema() for tool in self.tools]
+            if self.parallel_tools:
+                tools_schema.append(PARALLEL_TOOLS_SCHEMA)
+            tools_schema.append(final_answer_schema)
 
+            fused_schema = copy.deepcopy(tools_schema)
+            for function in fused_schema:
+                function["parameters"]["properties"]["thought"] = {"type": "string", "description": "Your reasoning about the steps to resolve the Goal and why this tool is the right one."}
+                function["parameters"]["required"] = ["thought"] + function["parameters"]["required"]
+
+            tools_schema_str = json.dumps(tools_schema)
+            self.prompt_prefix = {
+                "signature": signature,
+                "tools_schema": tools_schema,
+                "tools_schema_str": tools_schema_str,
+                "fused_schema": fused_schema,
+                "fused_schema_str": json.dumps(fused_schema),
+                "think_system_message": {"role": "system", "content": f"{SYSTEM_MESSAGE}\n{THINK_INSTRUCTIONS}\n\n[TOOLS]\n{tools_schema_str}"},
+                "fused_system_message": {"role": "system", "content": f"{SYSTEM_MESSAGE}\n{FUSED_INSTRUCTIONS}"},
+                "final_answer_system_message": {"role": "system", "content": f"{SYSTEM_MESSAGE}\n{FINAL_ANSWER_INSTRUCTIONS}"}
+            }
+            self.log.info(f"Built prompt prefix for {len(tools_schema)} tools ({len(tools_schema_str)} characters of schema).")
+        return self.prompt_prefix
+
+    # A copy, changing it must not change the cached prefix
     def get_tools_schema(self):
-        final_answer_schema = {
-            "name": "final_answer", 
-            "description": "Use this tool when you have all necessary information to resolve the Goal or no additional tools are required.", 
-            "parameters": {"type": "object", "properties": {}, "required": []}
-        }
-        tools_schema = [tool.get_schema() for tool in self.tools]
-        tools_schema.append(final_answer_schema)        
-        return tools_schema
+        return copy.deepcopy(self.get_prompt_prefix()["tools_schema"])
     
     def get_tools_schema_str(self):
-        return json.dumps(self.get_tools_schema())
+        return self.get_prompt_prefix()["tools_schema_str"]
+
+    # Records the prompt for the iteration stats and logs how much of it repeats the previous prompt of the same kind
+    def track_prompt(self, kind, prompt_text):
+        self.llm_prompts.append(prompt_text)
+        previous = self.last_prompts.get(kind)
+        self.last_prompts[kind] = prompt_text
+        if previous is None:
+            return
+        reused = len(os.path.commonprefix([previous, prompt_text]))
+        self.log.info(f"Prompt prefix reuse for {kind}: {reused / max(len(prompt_text), 1):.0%} ({reused} of {len(prompt_text)} characters)")
     
     def execute_chain_of_thought(self, goal: str, max_iterations: int=5):
+        final_answer = ""
+        for event in self.run_chain_of_thought(goal, max_iterations, stream=False):
+            if event["step"] == "Final Answer":
+                final_answer = event["content"]
+        return final_answer
+
+    # Yields the steps of the chain of thought as they happen. Thought and Final Answer are streamed
+    # as {"step", "delta"} events followed by a {"step", "content"} event with the full text.
+    def execute_chain_of_thought_stream(self, goal: str, max_iterations: int=5):
+        yield from self.run_chain_of_thought(goal, max_iterations, stream=True)
+
+    def run_chain_of_thought(self, goal, max_iterations, stream):
+        with span("agent.run", max_iterations=max_iterations, fused=self.fused, tools=len(self.tools)) as run_span:
+            final_answer = yield from self.run_steps(goal, max_iterations, stream, run_span)
+        return final_answer
+
+    def run_steps(self, goal, max_iterations, stream, run_span):
         start_time = time.time()
-        self.memory.add_to_memory("user", goal)
-        self.relevant_memories = self.memory.get_relevant_memories(goal)
+        with span("memory.add_to_memory"):
+            self.memory.add_to_memory("user", goal)
+        with span("memory.get_relevant_memories") as memory_span:
+            self.relevant_memories = self.memory.get_relevant_memories(goal)
+            memory_span.set_attributes(memories=len(self.memory.memory), relevant_memories=len(self.relevant_memories))
+        # Timestamps are left out so the same conversation always gives the same prompt (and cache key)
+        history = "\n".join(f"{memory['role']}: {memory['content']}" for memory in self.relevant_memories)
+        self.history = f"[HISTORY]\nHere is the conversation history between you and the user:\n{history}\n\n"
         self.goal = goal
-        self.scratchpad = "Goal: " + self.goal
+        self.scratchpad = Scratchpad(self.goal, max_tokens=self.scratchpad_tokens)
         self.log.info(f"Goal: {self.goal}", verbose=True)
+        yield {"step": "Goal", "content": self.goal}
         final_answer = ""
 
+        self.iteration_stats = []
+
         for iteration in range(max_iterations):
 
-            thought = self.think()
+            run_span.set_attribute("iterations", iteration + 1)
+            self.llm_prompts = []
+            iteration_start = time.perf_counter()
+            with track_usage() as usage:
+                if self.fused:
+                    thought, chosen_tool = self.think_and_select_tool()
+                    yield {"step": "Thought", "content": thought}
+                else:
+                    thought = yield from self.stream_step("Thought", self.think, stream)
+                    chosen_tool = self.select_tool()
+            self.record_iteration_stats(iteration, time.perf_counter() - iteration_start, thought, chosen_tool, usage)
+
             self.log.info(f"Thought: {thought}", verbose=True)
-            self.scratchpad += f"\nThought: {thought}"
-            
-            chosen_tool = self.select_tool()
+            self.scratchpad.add("Thought", thought)
             self.log.info(f"Action: {chosen_tool}", verbose=True)
-            self.scratchpad += f"\nAction: {chosen_tool}"
+            self.scratchpad.add("Action", chosen_tool)
+            yield {"step": "Action", "content": chosen_tool}
             
             if chosen_tool is None or chosen_tool.get("name","") == 'final_answer':
-                final_answer = self.final_answer()
-                self.scratchpad += f"\nFinal Answer: {final_answer}"
                 break
 
-            observation = self.act(chosen_tool)
+            with span("agent.act", tool=chosen_tool.get("name", "")):
+                observation = self.act(chosen_tool)
             self.log.info(f"Observation: {observation}", verbose=True)
-            self.scratchpad += f"\nObservation: {observation}"
+            self.scratchpad.add("Observation", observation)
+            yield {"step": "Observation", "content": observation}
 
-        else:
-            final_answer = self.final_answer()
-            self.scratchpad += f"\nFinal Answer: {final_answer}"
+        final_answer = yield from self.stream_step("Final Answer", self.final_answer, stream)
+        self.scratchpad.add("Final Answer", final_answer)
 
-        self.memory.add_to_memory("assistant", final_answer)
+        with span("memory.add_to_memory"):
+            self.memory.add_to_memory("assistant", final_answer)
         time_taken = time.time() - start_time
 
         minutes, seconds = divmod(time_taken, 60)
         log_str = f"Time Spent:\n{int(minutes)} minutes and {seconds:.2f} seconds\n"
         self.log.info(f"Final Answer: {final_answer}", verbose=True)
         self.log.info(log_str)
-
+        yield {"step": "Final Answer", "content": final_answer}
         return final_answer
 
-    def think(self):
-        system_message = {"role": "system", "content": f"{SYSTEM_MESSAGE}\n{THINK_INSTRUCTIONS}"} 
-        prompt = f"[HISTORY]\nHere is the conversation history between you and the user:\n{self.relevant_memories}\n\n"
-        prompt += f"[TOOLS]\n{self.get_tools_schema()}\n\n[GOAL]\n{self.goal}\n\n[SCRATCHPAD]\n{self.scratchpad}\nThought:"
-        result = generate_text(prompt, model=gpt4_model, messages=[system_message], stop=["Action:", "Final Answer:"])
+    def stream_step(self, step, generate, stream):
+        with span(f"agent.{generate.__name__}", stream=stream):
+            if not stream:
+                return generate()
+            content = ""
+            for delta in generate(stream=True):
+                content += delta
+                yield {"step": step, "delta": delta}
+            return content
+
+    # Token counts come from the usage of the LLM calls; calls served from the cache without usage
+    # are estimated from the prompts and the answers
+    def record_iteration_stats(self, iteration, latency, thought, chosen_tool, usage):
+        estimated = usage["calls"] < len(self.llm_prompts)
+        stats = {
+            "iteration": iteration,
+            "mode": "fused" if self.fused else "think+select_tool",
+            "llm_calls": len(self.llm_prompts),
+            "latency": latency,
+            "prompt_tokens": sum(count_tokens_many(self.llm_prompts)) if estimated else usage["prompt_tokens"],
+            "completion_tokens": count_tokens(thought) + count_tokens(json.dumps(chosen_tool)) if estimated else usage["completion_tokens"],
+            "estimated_tokens": estimated
+        }
+        self.iteration_stats.append(stats)
+        self.log.info(
+            f"Iteration {iteration} ({stats['mode']}): {stats['llm_calls']} LLM calls in {latency:.2f} seconds. "
+            f"Prompt tokens: {stats['prompt_tokens']}, completion tokens: {stats['completion_tokens']}"
+        )
+
+    def think(self, stream=False):
+        system_message = self.get_prompt_prefix()["think_system_message"]
+        prompt = f"{self.history}[GOAL]\n{self.goal}\n\n[SCRATCHPAD]\n{self.scratchpad}\nThought:"
+        self.track_prompt("think", system_message["content"] + prompt)
+        result = generate_text(prompt, model=gpt4_model, messages=[system_message], stop=["Action:", "Final Answer:"], stream=stream)
         return result
 
+    @traced("agent.select_tool")
     def select_tool(self):
-        functions = self.get_tools_schema()
-        prompt = f"[HISTORY]\nHere is the conversation history between you and the user:\n{self.relevant_memories}\n\n"  
-        prompt += f"[SCRATCHPAD]\n{self.scratchpad}"
+        prefix = self.get_prompt_prefix()
+        functions = prefix["tools_schema"]
+        prompt = f"{self.history}[SCRATCHPAD]\n{self.scratchpad}"
+        self.track_prompt("select_tool", prefix["tools_schema_str"] + prompt)
         result = generate_text_with_function_call(prompt, model=gpt4_model, functions=functions)
         return result
 
+    @traced("agent.think_and_select_tool")
+    def think_and_select_tool(self):
+        prefix = self.get_prompt_prefix()
+        functions = prefix["fused_schema"]
+        system_message = prefix["fused_system_message"]
+        prompt = f"{self.history}[GOAL]\n{self.goal}\n\n[SCRATCHPAD]\n{self.scratchpad}"
+        self.track_prompt("think_and_select_tool", prefix["fused_schema_str"] + system_message["content"] + prompt)
+        result = generate_text_with_function_call(prompt, model=gpt4_model, messages=[system_message], functions=functions)
+        if result is None:
+            return "", None
+
+        try:
+            arguments = json.loads(result.get("arguments") or "{}")
+        except Exception:
+            return "", dict(result)
+        thought = arguments.pop("thought", "")
+        return thought, {"name": result.get("name", ""), "arguments": json.dumps(arguments)}
+
     def act(self, input_json):
         func_name = input_json.get("name", "")
         if not func_name:
@@ -112,6 +293,9 @@ class Agent:
             except Exception as e:
                 return f"ERROR: Unable to parse tool arguments from action input: {e}"
 
+        if func_name == PARALLEL_TOOLS_SCHEMA["name"] and self.parallel_tools:
+            return self.act_parallel(args_dict.get("tool_calls", []))
+
         tool = None
         for t in self.tools:
             if t.func.__name__ == func_name:
@@ -127,9 +311,66 @@ class Agent:
 
         return result
 
-    def final_answer(self):
-        system_message = {"role": "system", "content": f"{SYSTEM_MESSAGE}\n{FINAL_ANSWER_INSTRUCTIONS}"}        
-        prompt = f"[HISTORY]\nHere is the conversation history between you and the user:\n{self.relevant_memories}\n\n"  
-        prompt += f"[GOAL]\n{self.goal}\n\n[SCRATCHPAD]\n{self.scratchpad}\nFinal Answer:"
-        result = generate_text(prompt, model=gpt35_16k_model, messages=[system_message])
+    def act_parallel(self, tool_calls):
+        if not isinstance(tool_calls, list) or not tool_calls:
+            return "ERROR: parallel_tools requires a non empty list of tool_calls."
+
+        # Results are reported in the order of the calls, regardless of which tool finishes first
+        futures = []
+        for tool_call in tool_calls:
+            if not isinstance(tool_call, dict):
+                futures.append((tool_call, None, None))
+                continue
+            call = {"name": tool_call.get("name", ""), "arguments": json.dumps(tool_call.get("arguments") or {})}
+            # A nested parallel_tools would wait on the same pool from one of its workers
+            if call["name"] == PARALLEL_TOOLS_SCHEMA["name"]:
+                futures.append((call, None, None))
+                continue
+            started = {"event": threading.Event(), "time": None}
+            # Each call runs in a copy of the current context, so its spans nest under this step
+            futures.append((call, self.executor.submit(contextvars.copy_context().run, self.run_tool_call, call, started), started))
+
+        results = []
+        for index, (call, future, started) in enumerate(futures, start=1):
+            if future is None:
+                result = "ERROR: parallel_tools can not be nested." if isinstance(call, dict) else "ERROR: Unable to parse tool call."
+            else:
+                result = self.wait_tool_call(call, future, started)
+            results.append(f"[{index}] {call.get('name', '') if isinstance(call, dict) else call}: {result}")
+        return "\n".join(results)
+
+    def run_tool_call(self, call, started):
+        started["time"] = time.monotonic()
+        started["event"].set()
+        return self.act(call)
+
+    # The timeout of a call counts from the moment it starts, a call may also wait that long in the
+    # queue for a free worker
+    def wait_tool_call(self, call, future, started):
+        timeout = self.get_tool_timeout(call["name"])
+        if not started["event"].wait(timeout) and future.cancel():
+            return f"ERROR: {call['name']} did not start within {timeout} seconds, all the tool workers were busy."
+        started["event"].wait()
+        try:
+            return future.result(timeout=max(0, started["time"] + timeout - time.monotonic()))
+        except TimeoutError:
+            # A running thread can not be stopped, the call keeps its worker until it returns
+            return f"ERROR: {call['name']} timed out after {timeout} seconds. It is still running in the background and its result will be discarded."
+
+    # Shuts down the tool workers of parallel_tools
+    def close(self):
+        if self.executor is not None:
+            self.close_executor()
+
+    def get_tool_timeout(self, func_name):
+        for tool in self.tools:
+            if tool.func.__name__ == func_name and tool.timeout:
+                return tool.timeout
+        return TOOL_TIMEOUT
+
+    def final_answer(self, stream=False):
+        system_message = self.get_prompt_prefix()["final_answer_system_message"]
+        prompt = f"{self.history}[GOAL]\n{self.goal}\n\n[SCRATCHPAD]\n{self.scratchpad}\nFinal Answer:"
+        model = router.route(count_message_tokens([system_message, {"role": "user", "content": prompt}]), FINAL_ANSWER_TOKENS, model=self.final_answer_model)
+        result = generate_text(prompt, model=model, messages=[system_message], stream=stream)
         return result
\ No newline at end of file
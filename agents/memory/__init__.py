@@ -1,3 +1,6 @@
 from .last_memories import LastMemories
 from .last_tokens import LastTokens
-from .relevant_memories import RelevantMemories
\ No newline at end of file
+from .relevant_memories import RelevantMemories
+from .embedding_store import EmbeddingStore
+from .ann_index import ExactIndex, IVFIndex
+from .memory_store import MemoryStore
\ No newline at end of file
@@ -0,0 +1,94 @@
+import numpy as np
+
+# Number of memories below which the indexes fall back to an exact scan
+EXACT_THRESHOLD = 5000
+
+class ExactIndex:
+    def __init__(self):
+        self.store = None
+
+    def bind(self, store):
+        self.store = store
+        self.reset()
+        self.rebuild()
+
+    def reset(self):
+        pass
+
+    def rebuild(self):
+        pass
+
+    def add(self, memory_index):
+        pass
+
+    # None means every stored embedding has to be scored
+    def candidates(self, query_embedding):
+        return None
+
+# Inverted file index: embeddings are clustered with spherical k-means and a query only
+# scores the memories of the `n_probe` closest clusters. Higher `n_probe` trades latency for recall.
+class IVFIndex(ExactIndex):
+    def __init__(self, n_lists=None, n_probe=8, exact_threshold=EXACT_THRESHOLD, kmeans_iterations=10, sample_per_list=64, seed=0):
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.exact_threshold = exact_threshold
+        self.kmeans_iterations = kmeans_iterations
+        self.sample_per_list = sample_per_list
+        self.rng = np.random.default_rng(seed)
+        super().__init__()
+
+    def reset(self):
+        self.centroids = None
+        self.lists = []
+        self.trained_size = 0
+
+    def rebuild(self):
+        if len(self.store) >= self.exact_threshold:
+            self.train()
+
+    def add(self, memory_index):
+        size = len(self.store)
+        if size < self.exact_threshold:
+            return
+        # Retrain whenever the history doubles so clusters track the data distribution
+        if self.centroids is None or size >= 2 * self.trained_size:
+            self.train()
+            return
+        vector = self.store.vectors()[memory_index]
+        self.lists[int(np.argmax(self.centroids @ vector))].append(memory_index)
+
+    def train(self):
+        vectors = self.store.vectors()
+        size = len(vectors)
+        n_lists = self.n_lists or max(1, int(np.sqrt(size)))
+        n_lists = min(n_lists, size)
+
+        sample_size = min(size, n_lists * self.sample_per_list)
+        sample = vectors[self.rng.choice(size, sample_size, replace=False)]
+        centroids = sample[self.rng.choice(sample_size, n_lists, replace=False)].copy()
+        for _ in range(self.kmeans_iterations):
+            assignments = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, sample)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            # Keep the previous centroid for clusters that ended up empty
+            centroids = np.where(norms > 0, sums / np.maximum(norms, 1e-12), centroids)
+
+        self.centroids = centroids
+        self.lists = [[] for _ in range(n_lists)]
+        for start in range(0, size, 4096):
+            batch_assignments = np.argmax(vectors[start:start + 4096] @ centroids.T, axis=1)
+            for offset, list_index in enumerate(batch_assignments):
+                self.lists[list_index].append(start + offset)
+        self.trained_size = size
+
+    def candidates(self, query_embedding):
+        if self.centroids is None or len(self.store) < self.exact_threshold:
+            return None
+        query = np.asarray(query_embedding, dtype=self.centroids.dtype)
+        n_probe = min(self.n_probe, len(self.lists))
+        probed = np.argpartition(-(self.centroids @ query), n_probe - 1)[:n_probe]
+        ids = np.concatenate([np.asarray(self.lists[list_index], dtype=np.int64) for list_index in probed])
+        if len(ids) == 0:
+            return None
+        return np.sort(ids)
@@ -0,0 +1,122 @@
+import json
+import os
+import numpy as np
+
+class EmbeddingStore:
+    def __init__(self, initial_capacity=1024, dtype=np.float32):
+        self.initial_capacity = initial_capacity
+        self.dtype = dtype
+        self.matrix = None
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def _allocate(self, capacity, dim):
+        matrix = np.zeros((capacity, dim), dtype=self.dtype)
+        if self.matrix is not None:
+            matrix[:self.size] = self.matrix[:self.size]
+        return matrix
+
+    def _ensure_capacity(self, dim):
+        if self.matrix is None:
+            self.matrix = self._allocate(self.initial_capacity, dim)
+        elif self.matrix.shape[1] != dim:
+            raise ValueError(f"Embedding dimension mismatch: expected {self.matrix.shape[1]}, got {dim}")
+        elif self.size == self.matrix.shape[0]:
+            # Grow geometrically so appends stay amortized O(1)
+            self.matrix = self._allocate(self.matrix.shape[0] * 2, dim)
+
+    def add(self, embedding):
+        vector = normalize(embedding, self.dtype)
+        self._ensure_capacity(vector.shape[0])
+        self.matrix[self.size] = vector
+        self.size += 1
+        return self.size - 1
+
+    def clear(self):
+        self.matrix = None
+        self.size = 0
+
+    def vectors(self):
+        if self.matrix is None:
+            return np.zeros((0, 0), dtype=self.dtype)
+        return self.matrix[:self.size]
+
+    def similarities(self, query_embedding, ids=None):
+        if self.size == 0:
+            return np.zeros(0, dtype=self.dtype)
+        vectors = self.vectors() if ids is None else self.vectors()[ids]
+        return vectors @ normalize(query_embedding, self.dtype)
+
+    def scores(self, query_embedding, sim_k=0.8, rec_k=0.25, ids=None):
+        similarities = self.similarities(query_embedding, ids)
+        positions = np.arange(self.size) if ids is None else ids
+        recency = positions.astype(self.dtype) / max(self.size, 1)
+        return (sim_k * similarities) + (rec_k * recency), similarities
+
+# Keeps the matrix in a float32 file mapped into memory, so large histories are opened without
+# reading them into RAM. Rows past `size` are preallocated space and are ignored.
+class MappedEmbeddingStore(EmbeddingStore):
+    def __init__(self, filename, size=0, read_only=False, initial_capacity=1024, dtype=np.float32):
+        super().__init__(initial_capacity, dtype)
+        self.filename = filename
+        self.meta_file = filename + ".json"
+        self.read_only = read_only
+        self.remap(size)
+
+    def remap(self, size):
+        self.matrix = None
+        self.size = 0
+        if not (os.path.exists(self.filename) and os.path.exists(self.meta_file)):
+            return
+        with open(self.meta_file, "r", encoding="utf-8") as f:
+            dim = json.load(f)["dim"]
+        rows = os.path.getsize(self.filename) // (dim * np.dtype(self.dtype).itemsize)
+        if rows > 0:
+            mode = "r" if self.read_only else "r+"
+            self.matrix = np.memmap(self.filename, dtype=self.dtype, mode=mode, shape=(rows, dim))
+        self.size = min(size, rows)
+
+    def _allocate(self, capacity, dim):
+        if self.read_only:
+            raise PermissionError(f"Embedding store {self.filename} is read only")
+        if self.matrix is None:
+            with open(self.meta_file, "w", encoding="utf-8") as f:
+                json.dump({"dim": dim, "dtype": np.dtype(self.dtype).name}, f)
+        else:
+            self.matrix.flush()
+        # Growing the file keeps the rows already written, no copy is needed
+        with open(self.filename, "ab") as f:
+            f.truncate(capacity * dim * np.dtype(self.dtype).itemsize)
+        return np.memmap(self.filename, dtype=self.dtype, mode="r+", shape=(capacity, dim))
+
+    def flush(self):
+        if self.matrix is not None and not self.read_only:
+            self.matrix.flush()
+
+    def clear(self):
+        super().clear()
+        if self.read_only:
+            return
+        for file in (self.filename, self.meta_file):
+            if os.path.exists(file):
+                os.remove(file)
+
+def normalize(embedding, dtype=np.float32):
+    vector = np.asarray(embedding, dtype=dtype)
+    norm = np.linalg.norm(vector)
+    if norm == 0:
+        return vector
+    return vector / norm
+
+# Indices of the k highest scores, sorted by descending score
+def top_k(scores, k):
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    if k < len(scores):
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
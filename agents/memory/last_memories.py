@@ -1,19 +1,44 @@
 from datetime import datetime
 
 class LastMemories:
-    def __init__(self):            
-        self.memory = []
+    def __init__(self, store=None):
+        self.store = store
+        self.memory = store.load() if store else []
 
-    def add_to_memory(self, role, content):
-        memory_item = {
+    def create_memory_item(self, role, content):
+        return {
             "timestamp": datetime.now(),
             "role": role,
             "content": content
         }
+
+    def create_memory_items(self, messages):
+        return [self.create_memory_item(message["role"], message["content"]) for message in messages]
+
+    def add_to_memory(self, role, content):
+        memory_item = self.create_memory_item(role, content)
         self.memory.append(memory_item)
+        if self.store:
+            self.store.append(memory_item)
+
+    # Adds a list of {"role", "content"} messages, e.g. the "conversation" of conversation.json
+    def add_many_to_memory(self, messages):
+        memory_items = self.create_memory_items(messages)
+        self.memory.extend(memory_items)
+        if self.store:
+            self.store.append_many(memory_items)
+
+    def refresh(self):
+        if not self.store:
+            return []
+        new_items = self.store.read_new()
+        self.memory.extend(new_items)
+        return new_items
     
     def clean_memory(self):
         self.memory = []
+        if self.store:
+            self.store.clear()
         
     def get_last_memories(self, n=5):
         if n > len(self.memory):
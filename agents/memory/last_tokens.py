@@ -1,27 +1,71 @@
-from llm import count_tokens
+import numpy as np
+from llm import count_tokens, count_tokens_many
 from utils import Logger
 from .last_memories import LastMemories
 
 class LastTokens(LastMemories):
-    def __init__(self):            
-        super().__init__()
-        self.log = Logger()
+    def __init__(self, store=None):
+        super().__init__(store)
+        self.log = Logger(name="memory")
+        # token_prefix[i] is the number of tokens in the first i memories
+        self.token_prefix = np.zeros(1024, dtype=np.int64)
+        self.track_tokens(self.memory)
+
+    @property
+    def total_tokens(self):
+        return int(self.token_prefix[len(self.memory)])
+
+    def token_counts(self):
+        return np.diff(self.token_prefix[:len(self.memory) + 1])
+
+    def track_tokens(self, memory_items):
+        if not memory_items:
+            return
+        end = len(self.memory)
+        start = end - len(memory_items)
+        if end + 1 > len(self.token_prefix):
+            token_prefix = np.zeros(max(end + 1, 2 * len(self.token_prefix)), dtype=np.int64)
+            token_prefix[:start + 1] = self.token_prefix[:start + 1]
+            self.token_prefix = token_prefix
+        token_counts = [memory_item.get("token_count", 0) for memory_item in memory_items]
+        self.token_prefix[start + 1:end + 1] = self.token_prefix[start] + np.cumsum(token_counts)
+
+    def create_memory_item(self, role, content, token_count=None):
+        memory_item = super().create_memory_item(role, content)
+        memory_item["token_count"] = count_tokens(content) if token_count is None else token_count
+        return memory_item
+
+    def create_memory_items(self, messages):
+        token_counts = count_tokens_many([message["content"] for message in messages])
+        return [
+            self.create_memory_item(message["role"], message["content"], token_count)
+            for message, token_count in zip(messages, token_counts)
+        ]
 
     def add_to_memory(self, role, content):
         super().add_to_memory(role, content)
-        memory_item = self.memory[-1]
-        memory_item["token_count"] = count_tokens(content)
-        self.log_memory_update(memory_item)
+        self.track_tokens(self.memory[-1:])
+        self.log_memory_update(self.memory[-1])
+
+    def add_many_to_memory(self, messages):
+        super().add_many_to_memory(messages)
+        if messages:
+            self.track_tokens(self.memory[-len(messages):])
+            self.log_memory_update(self.memory[-1])
+
+    def refresh(self):
+        new_items = super().refresh()
+        self.track_tokens(new_items)
+        return new_items
 
     def log_memory_update(self, memory_item):
-        total_memory_tokens = sum([mem.get("token_count", 0) for mem in self.memory])
         self.log.info(
             f"Adding memory item {len(self.memory)} with {memory_item['token_count']} tokens. "
-            f"Total memory tokens: {total_memory_tokens}"
+            f"Total memory tokens: {self.total_tokens}"
         )
     
     def get_last_tokens(self, max_tokens=2000):
-        total_memory_tokens = sum([mem.get("token_count", 0) for mem in self.memory])
+        total_memory_tokens = self.total_tokens
         if total_memory_tokens < max_tokens:
             return [
                 {
@@ -30,17 +74,13 @@ class LastTokens(LastMemories):
                     "timestamp" : memory["timestamp"]
                 } for memory in self.memory][::-1]
 
-        _messages = []
-        _tokens = 0
-        for memory in reversed(self.memory):
-            _tokens += memory.get("token_count", 0)
-            if _tokens >= max_tokens:
-                break
-            
-            _messages.append({
+        # The window starts at the first memory whose suffix sum of tokens is below max_tokens
+        token_prefix = self.token_prefix[:len(self.memory) + 1]
+        start = int(np.searchsorted(token_prefix, total_memory_tokens - max_tokens, side="right"))
+
+        return [
+            {
                 "role": memory["role"],
                 "content": memory["content"],
                 "timestamp" : memory["timestamp"]
-            })
-            
-        return _messages[::-1]
\ No newline at end of file
+            } for memory in self.memory[start:]]
\ No newline at end of file
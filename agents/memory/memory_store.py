@@ -0,0 +1,103 @@
+import json
+import os
+from datetime import datetime
+from .embedding_store import MappedEmbeddingStore
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
+# Append-only persistence for the memory classes. Text and metadata go to a JSON lines log,
+# embeddings to a float32 file that is memory-mapped on open. The log is the source of truth:
+# a memory exists once its line is complete, so readers in other processes can follow the
+# files while a single writer appends to them. The writer holds a lock on the directory, so a
+# second writer (in this or another process) fails to open instead of writing the same rows.
+# Only the embeddings stay on disk: load() decodes the whole log, so the text and metadata of
+# every memory are held in RAM by the memory classes.
+class MemoryStore:
+    def __init__(self, path="./memory", read_only=False):
+        self.path = path
+        self.read_only = read_only
+        self.log_file = os.path.join(path, "memory.jsonl")
+        self.embeddings_file = os.path.join(path, "embeddings.f32")
+        self.lock_file = os.path.join(path, "writer.lock")
+        self.lock_fd = None
+        self.offset = 0
+        if not read_only:
+            os.makedirs(path, exist_ok=True)
+            self.acquire_writer_lock()
+
+    def acquire_writer_lock(self):
+        fd = os.open(self.lock_file, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fcntl:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        except OSError:
+            os.close(fd)
+            raise RuntimeError(f"Memory store {self.path} is already open for writing, share that instance or open it with read_only=True")
+        self.lock_fd = fd
+
+    # Releases the writer lock, the store can not be written after closing it
+    def close(self):
+        if self.lock_fd is not None:
+            os.close(self.lock_fd)
+            self.lock_fd = None
+            self.read_only = True
+
+    def load(self):
+        self.offset = 0
+        return self.read_new()
+
+    def read_new(self):
+        if not os.path.exists(self.log_file):
+            return []
+
+        memory_items = []
+        with open(self.log_file, "rb") as f:
+            f.seek(self.offset)
+            for line in f:
+                # Ignore a trailing line that is still being written
+                if not line.endswith(b"\n"):
+                    break
+                self.offset += len(line)
+                memory_items.append(decode_memory_item(line))
+        return memory_items
+
+    def append(self, memory_item):
+        self.append_many([memory_item])
+
+    def append_many(self, memory_items):
+        if self.read_only:
+            raise PermissionError(f"Memory store {self.path} is read only")
+        lines = "".join(json.dumps(encode_memory_item(memory_item), ensure_ascii=False) + "\n" for memory_item in memory_items)
+        fd = os.open(self.log_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, lines.encode("utf-8"))
+        finally:
+            os.close(fd)
+        self.offset = os.path.getsize(self.log_file)
+
+    def clear(self):
+        if self.read_only:
+            raise PermissionError(f"Memory store {self.path} is read only")
+        if os.path.exists(self.log_file):
+            os.remove(self.log_file)
+        self.offset = 0
+
+    def embedding_store(self, size):
+        return MappedEmbeddingStore(self.embeddings_file, size=size, read_only=self.read_only)
+
+def encode_memory_item(memory_item):
+    encoded = {key: value for key, value in memory_item.items() if key != "embedding"}
+    encoded["timestamp"] = memory_item["timestamp"].isoformat()
+    return encoded
+
+def decode_memory_item(line):
+    memory_item = json.loads(line)
+    memory_item["timestamp"] = datetime.fromisoformat(memory_item["timestamp"])
+    return memory_item
@@ -1,62 +1,111 @@
-from llm import generate_embeddings
-from utils import  vector_similarity
+import threading
+import numpy as np
+from llm import generate_embeddings, generate_embeddings_batch
+from .ann_index import ExactIndex
+from .embedding_store import EmbeddingStore, top_k
 from .last_tokens import LastTokens
 
+# Initial number of top scored memories considered when trimming to the token budget
+TOP_K = 64
+
 class RelevantMemories(LastTokens):
-    def __init__(self):            
-        super().__init__()
+    def __init__(self, index=None, store=None):
+        super().__init__(store)
+        self.embeddings = store.embedding_store(len(self.memory)) if store else EmbeddingStore()
+        if len(self.embeddings) != len(self.memory):
+            raise ValueError(f"Memory store has {len(self.memory)} memories but {len(self.embeddings)} embeddings")
+        self.index = index or ExactIndex()
+        self.index.bind(self.embeddings)
+        # Embedding rows and memories must be appended in the same order, also when several
+        # agents share this instance
+        self.lock = threading.RLock()
 
     def add_to_memory(self, role, content):
-        super().add_to_memory(role, content)
-        memory_item = self.memory[-1]
-        memory_item["embedding"] = generate_embeddings(content)
-        self.log_memory_update(memory_item)
+        # The embedding row is written before the memory is persisted, so the log never
+        # references an embedding that does not exist
+        embedding = generate_embeddings(content)
+        with self.lock:
+            memory_index = self.embeddings.add(embedding)
+            super().add_to_memory(role, content)
+            self.index.add(memory_index)
+            self.log_memory_update(self.memory[-1])
+
+    def add_many_to_memory(self, messages):
+        embeddings = generate_embeddings_batch([message["content"] for message in messages])
+        with self.lock:
+            first_index = len(self.embeddings)
+            for embedding in embeddings:
+                self.embeddings.add(embedding)
+            super().add_many_to_memory(messages)
+            for memory_index in range(first_index, len(self.embeddings)):
+                self.index.add(memory_index)
+
+    def refresh(self):
+        with self.lock:
+            new_items = super().refresh()
+            if new_items:
+                self.embeddings.remap(len(self.memory))
+                for memory_index in range(len(self.memory) - len(new_items), len(self.memory)):
+                    self.index.add(memory_index)
+            return new_items
+
+    def clean_memory(self):
+        with self.lock:
+            self.embeddings.clear()
+            self.index.reset()
+            super().clean_memory()
 
     def get_relevant_memories(self, query, max_tokens = 2000, sim_k = 0.8, rec_k = 0.25):
-        total_memory_tokens = sum([memory_item["token_count"] for memory_item in self.memory])
-        if total_memory_tokens < max_tokens:
-            return [{
-                    "role": memory["role"], 
-                    "content": memory["content"], 
-                    "timestamp": memory["timestamp"]} 
-                for memory in self.memory]
+        with self.lock:
+            if self.total_tokens < max_tokens:
+                return [{
+                        "role": memory["role"],
+                        "content": memory["content"],
+                        "timestamp": memory["timestamp"]}
+                    for memory in self.memory]
 
         self.log.info(f"Executing get_relevant_memories with the following parameters: max_tokens: {max_tokens}, sim_k: {sim_k}, rec_k: {rec_k}, Query: {query}")
 
-        relevant_memories = []
         query_embedding = generate_embeddings(query)
+        # Memories added by another session while scoring would change the lengths of the arrays
+        with self.lock:
+            return self.rank_memories(query_embedding, max_tokens, sim_k, rec_k)
 
-        for memory_index, memory in enumerate(self.memory):
-            similarity = vector_similarity(query_embedding, memory["embedding"])
-            recency = memory_index / len(self.memory)
-            score = (sim_k * similarity) + (rec_k * recency)
+    def rank_memories(self, query_embedding, max_tokens, sim_k, rec_k):
+        candidates = self.index.candidates(query_embedding)
+        scores, similarities = self.embeddings.scores(query_embedding, sim_k, rec_k, ids=candidates)
+        token_counts = self.token_counts()
+        if candidates is not None:
+            token_counts = token_counts[candidates]
+        if len(scores) == 0:
+            return []
 
-            self.log.info(f"Calculating score for memory {memory_index}: Similarity: {similarity:.2f} - Recency: {recency:.2f} => Score: {score:.2f}")
-
-            relevant_memories.append({
-                "content": memory["content"],
-                "score": score,
-                "token_count": memory["token_count"],
-                "timestamp" : memory["timestamp"],
-                "role" : memory["role"]
-            })
+        # Rank only as many memories as needed to fill the token budget, widening the window if it is not enough
+        k = TOP_K
+        while True:
+            ranked = top_k(scores, k)
+            cumulative_tokens = np.cumsum(token_counts[ranked])
+            if cumulative_tokens[-1] > max_tokens or k >= len(scores):
+                break
+            k *= 2
 
-        relevant_memories.sort(key=lambda x: x["score"], reverse=True)
-        total_token_count = sum(memory["token_count"] for memory in relevant_memories)
-        self.log.info("[REMOVED MEMORIES]")
-        while total_token_count > max_tokens:
-            removed_memory = relevant_memories.pop()
-            total_token_count -= removed_memory["token_count"]
-            self.log.info(f"Removed memory with {removed_memory['token_count']} tokens.")
+        selected = np.sort(ranked[cumulative_tokens <= max_tokens])
+        self.log.info(
+            f"Scored {len(scores)} memories: kept {len(selected)} with {int(token_counts[selected].sum())} tokens. "
+            f"Best score: {scores[ranked[0]]:.2f} (similarity: {similarities[ranked[0]]:.2f})"
+        )
+        self.log.info(f"[REMOVED MEMORIES] {len(scores) - len(selected)} memories with {int(token_counts.sum() - token_counts[selected].sum())} tokens.")
 
-        relevant_memories.sort(key=lambda x: x["timestamp"], reverse=False)
+        if candidates is not None:
+            selected = candidates[selected]
 
         relevant_messages = []
-        for memory in relevant_memories:
+        for memory_index in selected:
+            memory = self.memory[memory_index]
             relevant_messages.append({
                 "role" : memory["role"],
                 "content": memory["content"],
                 "timestamp": memory["timestamp"]
             })
 
-        return relevant_messages
\ No newline at end of file
+        return relevant_messages
@@ -0,0 +1,104 @@
+from llm import count_tokens, truncate_tokens
+
+# A recent observation is omitted instead of truncated to fewer tokens than this
+MIN_OBSERVATION_TOKENS = 20
+# Tokens of the "... (n earlier steps omitted)" line
+OMITTED_LINE_TOKENS = 12
+
+# Structured scratchpad with a token budget. The last `keep_last` steps are rendered verbatim;
+# older observations are truncated (or summarized, if a `summarize` function is given) to
+# `max_observation_tokens`, and when that is still over `max_tokens` the oldest steps are omitted.
+# If the recent steps alone are over the budget, their observations are truncated to the tokens
+# left, newest first, and the older recent steps omitted. The newest Thought and Action are always
+# kept whole, they are the only part that can go over `max_tokens`.
+class Scratchpad:
+    def __init__(self, goal, max_tokens=3000, keep_last=4, max_observation_tokens=200, summarize=None):
+        self.goal = goal
+        self.max_tokens = max_tokens
+        self.keep_last = keep_last
+        self.max_observation_tokens = max_observation_tokens
+        self.summarize = summarize
+        self.steps = []
+        self.rendered = None
+
+    def add(self, step, content):
+        line = f"{step}: {content}"
+        self.steps.append({"step": step, "content": content, "line": line, "tokens": count_tokens(line), "compact": None})
+        self.rendered = None
+
+    def __str__(self):
+        if self.rendered is None:
+            self.rendered = self.render()
+        return self.rendered
+
+    def __len__(self):
+        return len(self.steps)
+
+    def compact(self, step):
+        if step["compact"] is None:
+            if step["step"] != "Observation" or step["tokens"] <= self.max_observation_tokens:
+                line = step["line"]
+            elif self.summarize:
+                line = f"Observation (summary): {self.summarize(str(step['content']), self.max_observation_tokens)}"
+            else:
+                line = f"Observation: {truncate_tokens(str(step['content']), self.max_observation_tokens)}... [truncated, {step['tokens']} tokens]"
+            step["compact"] = {"line": line, "tokens": count_tokens(line)}
+        return step["compact"]
+
+    def render(self):
+        split = max(0, len(self.steps) - self.keep_last)
+        older = [self.compact(step) for step in self.steps[:split]]
+        recent = self.steps[split:]
+
+        # Every line but the goal is preceded by a line break, counted as one token
+        goal_tokens = count_tokens(f"Goal: {self.goal}")
+        older_tokens = sum(step["tokens"] + 1 for step in older)
+        recent_tokens = sum(step["tokens"] + 1 for step in recent)
+        omitted = 0
+        while older and goal_tokens + older_tokens + recent_tokens + (OMITTED_LINE_TOKENS if omitted else 0) > self.max_tokens:
+            older_tokens -= older.pop(0)["tokens"] + 1
+            omitted += 1
+
+        recent_lines = [step["line"] for step in recent]
+        if goal_tokens + older_tokens + recent_tokens > self.max_tokens:
+            recent_lines = self.fit_recent(recent, self.max_tokens - goal_tokens - OMITTED_LINE_TOKENS)
+            omitted += len(recent) - len(recent_lines)
+
+        lines = [f"Goal: {self.goal}"]
+        if omitted:
+            lines.append(f"... ({omitted} earlier steps omitted)")
+        lines.extend(step["line"] for step in older)
+        lines.extend(recent_lines)
+        return "\n".join(lines)
+
+    # Lines of the recent steps that fit in max_tokens, in order. The newest Thought and Action are
+    # kept, the rest of the budget goes to the other steps from the newest; observations that do
+    # not fit whole are truncated. Once a step is left out, the older ones are left out too.
+    def fit_recent(self, recent, max_tokens):
+        kept = {}
+        for name in ("Thought", "Action"):
+            for i in range(len(recent) - 1, -1, -1):
+                if recent[i]["step"] == name:
+                    kept[i] = recent[i]["line"]
+                    max_tokens -= recent[i]["tokens"] + 1
+                    break
+
+        for i in range(len(recent) - 1, -1, -1):
+            if i in kept:
+                continue
+            step = recent[i]
+            if step["tokens"] + 1 <= max_tokens:
+                kept[i] = step["line"]
+                max_tokens -= step["tokens"] + 1
+                continue
+            if step["step"] == "Observation":
+                suffix = f"... [truncated, {step['tokens']} tokens]"
+                # The prefix, the suffix and the line break, plus a margin for the tokens merged
+                # where the truncated content meets them
+                content_tokens = max_tokens - count_tokens(f"Observation: {suffix}") - 3
+                if content_tokens >= MIN_OBSERVATION_TOKENS:
+                    line = f"Observation: {truncate_tokens(str(step['content']), content_tokens)}{suffix}"
+                    kept[i] = line
+                    max_tokens -= count_tokens(line) + 1
+            break
+        return [kept[i] for i in sorted(kept)]
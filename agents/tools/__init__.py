@@ -1 +1,2 @@
-from .tools import Tool, Parameter
\ No newline at end of file
+from .tools import Tool, Parameter
+from .file_cache import file_cache, FileCache
\ No newline at end of file
@@ -0,0 +1,98 @@
+import os
+import sys
+import threading
+from collections import OrderedDict
+from llm import count_tokens
+
+# Bytes held in memory by a value, including the items of lists and tuples
+def sizeof(value):
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(sizeof(item) for item in value)
+    return sys.getsizeof(value)
+
+# Decoded content of a file, with the values derived from it (token count, chunks...) computed
+# once per version of the file. nbytes is the memory held by the content and the derived values.
+class CachedFile:
+    def __init__(self, path, mtime, size, content, cache=None):
+        self.path = path
+        self.mtime = mtime
+        self.size = size
+        self.content = content
+        self.cache = cache
+        self.nbytes = sys.getsizeof(content)
+        self.derived = {}
+        self.lock = threading.Lock()
+
+    def memoize(self, key, compute):
+        with self.lock:
+            if key in self.derived:
+                return self.derived[key]
+            value = self.derived[key] = compute(self.content)
+        if self.cache is not None:
+            self.cache.grow(self, sizeof(value))
+        else:
+            self.nbytes += sizeof(value)
+        return value
+
+    @property
+    def tokens(self):
+        return self.memoize("tokens", count_tokens)
+
+# Text files keyed by (path, mtime, size), so a file viewed and then queried, or queried again,
+# is not read, decoded and tokenized again while it does not change. Least recently used files
+# are dropped once the decoded files and their derived values add up to more than max_bytes.
+class FileCache:
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.files = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    # Raises the same errors as opening and decoding the file
+    def get(self, filepath):
+        stat = os.stat(filepath)
+        with self.lock:
+            cached = self.files.get(filepath)
+            if cached and cached.mtime == stat.st_mtime and cached.size == stat.st_size:
+                self.files.move_to_end(filepath)
+                self.hits += 1
+                return cached
+            self.misses += 1
+
+        with open(filepath, "r", encoding="utf-8") as infile:
+            cached = CachedFile(filepath, stat.st_mtime, stat.st_size, infile.read(), cache=self)
+        with self.lock:
+            self._remember(cached)
+        return cached
+
+    def _remember(self, cached):
+        previous = self.files.pop(cached.path, None)
+        if previous:
+            self.total_bytes -= previous.nbytes
+        if cached.nbytes > self.max_bytes:
+            return
+        self.files[cached.path] = cached
+        self.total_bytes += cached.nbytes
+        self._evict()
+
+    # Adds the size of a value memoized by a cached file
+    def grow(self, cached, nbytes):
+        with self.lock:
+            cached.nbytes += nbytes
+            if self.files.get(cached.path) is cached:
+                self.total_bytes += nbytes
+                self._evict()
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes:
+            _, evicted = self.files.popitem(last=False)
+            self.total_bytes -= evicted.nbytes
+
+    def clear(self):
+        with self.lock:
+            self.files.clear()
+            self.total_bytes = 0
+
+file_cache = FileCache(int(os.getenv("FILE_CACHE_MAX_BYTES", str(64 * 1024 * 1024))))
@@ -1,3 +1,5 @@
 from .list_directory import ListDirectory
 from .search_directory import SearchDirectory
-from .view_file import ViewFile
\ No newline at end of file
+from .view_file import ViewFile
+from .semantic_search import SemanticSearch
+from .grep_files import GrepFiles
\ No newline at end of file
@@ -0,0 +1,148 @@
+import os
+import re
+import threading
+from utils import Logger
+
+# Cached listing of a directory tree, shared by the fs tools. Directories are listed once with
+# os.scandir and listed again only when they change: either their mtime changed (creating,
+# deleting or renaming an entry updates the mtime of its directory) or, with watch=True, the
+# watchdog observer reported an event in them.
+class FileIndex:
+    def __init__(self, root="./data", watch=False):
+        self.root = root
+        self.log = Logger(name="file_index")
+        self.lock = threading.RLock()
+        self.dirs = {}
+        # Bumped whenever a listing changes, it invalidates the cached counts
+        self.generation = 0
+        self.counts = {}
+        self.dirty = set()
+        self.observer = None
+        if watch:
+            self.start_watcher()
+
+    def start_watcher(self):
+        try:
+            from watchdog.events import FileSystemEventHandler
+            from watchdog.observers import Observer
+        except ImportError:
+            self.log.warn("watchdog is not installed, the file index falls back to directory mtimes")
+            return
+        if not os.path.isdir(self.root):
+            return
+
+        index = self
+        class Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                with index.lock:
+                    for path in (event.src_path, getattr(event, "dest_path", "")):
+                        if path:
+                            index.dirty.add(os.path.abspath(os.path.dirname(path)))
+                            if event.is_directory:
+                                index.dirty.add(os.path.abspath(path))
+
+        self.observer = Observer()
+        self.observer.schedule(Handler(), self.root, recursive=True)
+        self.observer.daemon = True
+        self.observer.start()
+
+    def stop_watcher(self):
+        if self.observer is not None:
+            self.observer.stop()
+            self.observer.join()
+            self.observer = None
+
+    def is_stale(self, path, entry):
+        if self.observer is not None:
+            return os.path.abspath(path) in self.dirty
+        try:
+            return os.stat(path).st_mtime_ns != entry["mtime"]
+        except OSError:
+            return True
+
+    def scan(self, path):
+        dirs, links, files = [], [], []
+        try:
+            # The mtime is taken before listing, so a change during the scan is seen next time
+            mtime = os.stat(path).st_mtime_ns
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    # A link to a directory is a directory, as for os.path.isdir
+                    if entry.is_dir():
+                        dirs.append(entry.name)
+                        if entry.is_symlink():
+                            links.append(entry.name)
+                    else:
+                        files.append(entry.name)
+        except OSError:
+            # Deleted (or unreadable) directories are dropped from the cache
+            if self.dirs.pop(path, None) is not None:
+                self.generation += 1
+            return {"mtime": None, "dirs": [], "links": [], "files": []}
+        self.dirty.discard(os.path.abspath(path))
+        entry = {"mtime": mtime, "dirs": sorted(dirs), "links": links, "files": sorted(files)}
+        previous = self.dirs.get(path)
+        if previous is None or any(previous[key] != entry[key] for key in ("dirs", "links", "files")):
+            self.generation += 1
+        self.dirs[path] = entry
+        return entry
+
+    def listing(self, path):
+        path = path.rstrip("/") or "/"
+        with self.lock:
+            entry = self.dirs.get(path)
+            if entry is None or self.is_stale(path, entry):
+                entry = self.scan(path)
+            return entry
+
+    # Subdirectory and file names of the directory, sorted. Links to directories are subdirectories.
+    def list_dir(self, path):
+        entry = self.listing(path)
+        return entry["dirs"], entry["files"]
+
+    # Revalidates every cached directory, so the cached counts can be trusted
+    def refresh(self):
+        with self.lock:
+            for path, entry in list(self.dirs.items()):
+                if self.is_stale(path, entry):
+                    self.scan(path)
+
+    # Lazily yields the file paths under `path` in os.walk order, skipping the directories named
+    # in skip_dirs. Only the directories reached by the caller are listed or revalidated. Like
+    # os.walk, links to directories are not followed, so a link to a parent does not loop.
+    def iter_files(self, path=None, skip_dirs=()):
+        path = (path or self.root).rstrip("/")
+        entry = self.listing(path)
+        for filename in entry["files"]:
+            yield f"{path}/{filename}"
+        for dirname in entry["dirs"]:
+            if dirname not in skip_dirs and dirname not in entry["links"]:
+                yield from self.iter_files(f"{path}/{dirname}", skip_dirs)
+
+    # Paths under the root matching the regex, lazily
+    def search(self, regex=None):
+        pattern = re.compile(regex) if regex else None
+        for filepath in self.iter_files():
+            if pattern is None or pattern.search(filepath):
+                yield filepath
+
+    # Number of paths matching the regex, cached until the tree changes
+    def count(self, regex=None):
+        with self.lock:
+            self.refresh()
+            cached = self.counts.get(regex)
+            if cached and cached[0] == self.generation:
+                return cached[1]
+            total = sum(1 for _ in self.search(regex))
+            self.counts[regex] = (self.generation, total)
+            return total
+
+file_indexes = {}
+file_indexes_lock = threading.Lock()
+
+# Shared index of a root, FILE_INDEX_WATCH=1 enables the watchdog observer
+def get_file_index(root="./data"):
+    with file_indexes_lock:
+        if root not in file_indexes:
+            file_indexes[root] = FileIndex(root, watch=os.getenv("FILE_INDEX_WATCH", "0") == "1")
+        return file_indexes[root]
@@ -0,0 +1,57 @@
+import re
+from itertools import islice
+from agents.tools import Tool, Parameter
+from llm import exceeds_token_limit
+from .trigram_index import get_trigram_index
+
+MAX_TOKENS = 2000
+
+class GrepFiles(Tool):
+    def __init__(self, index=None):
+        self.index = index or get_trigram_index()
+        super().__init__(
+            name="grep_files",
+            func=self.grep_files,
+            description="Search the content of the text files in the ./data directory and its subdirectories using a regular expression. Returns the matching lines with their file path, line number and surrounding lines.",
+            arguments=[
+                Parameter("regex", "Regular expression matched against every line of the files.", str, required=True),
+                Parameter("context_lines", "The number of lines to show before and after every match. Default=1.", int, required=False),
+                Parameter("page_size", "The number of matches in each page. Default=20.", int, required=False),
+                Parameter("page_number", "The page number to return. Default=1.", int, required=False)
+            ]
+        )
+
+    def grep_files(self, regex=None, context_lines=1, page_size=20, page_number=1):
+        if not regex:
+            return "ERROR: Missing argument. Regex is required."
+
+        try:
+            re.compile(regex)
+        except re.error:
+            return "ERROR: Invalid regular expression"
+
+        # Picks up the files added or modified since the last search
+        self.index.update()
+
+        # Use pagination, the candidate files are read lazily until the page (plus one match, to
+        # know if there is a next page) is filled
+        start = (page_number - 1) * page_size
+        end = start + page_size
+        page_matches = list(islice(self.index.grep(regex, context_lines), start, end + 1))
+        has_more = len(page_matches) > page_size
+        page_matches = page_matches[:page_size]
+
+        # Error handling for no matches
+        if len(page_matches) == 0:
+            return f"No matches found for the given regex {regex}."
+
+        return_string = f"Search results (page {page_number}{', more results in the next page' if has_more else ''}):\n"
+        for match in page_matches:
+            lines = "\n".join(f"{'>' if number == match['line'] else ' '} {number}| {line}" for number, line in match["context"])
+            return_string += f"- {match['path']}:{match['line']}\n'''\n{lines}\n'''\n"
+
+        # Check for token count limit
+        if exceeds_token_limit(return_string, MAX_TOKENS):
+            return "ERROR: The return string is too long. Please try again with a smaller page size or fewer context lines."
+
+        return f"Search results: {len(page_matches)} matches:\n{return_string}"
@@ -0,0 +1,106 @@
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+from llm import count_tokens_many, truncate_tokens
+
+# Bytes read at a time when looking for the line breaks
+READ_BLOCK_BYTES = 1024 * 1024
+# Bytes per token assumed when reading the lines of a new page, the usual average is about 4
+PAGE_TOKEN_BYTES = 6
+# Line indexes kept in memory, least recently used are dropped first
+MAX_LINE_INDEXES = 64
+
+# Byte offset of every line of a file, so any range of lines is read with one seek and one read
+# instead of the whole file. Built once per (mtime, size) of the file, reading it in blocks.
+# Pages of up to `page_tokens` tokens are found the first time they are requested and reused.
+class LineIndex:
+    def __init__(self, filepath):
+        self.filepath = filepath
+        stat = os.stat(filepath)
+        self.mtime = stat.st_mtime
+        self.size = stat.st_size
+        self.pages = {}
+        self.lock = threading.Lock()
+        starts = [np.zeros(1, dtype=np.int64)]
+        with open(filepath, "rb") as f:
+            position = 0
+            while block := f.read(READ_BLOCK_BYTES):
+                starts.append(np.flatnonzero(np.frombuffer(block, dtype=np.uint8) == 10) + position + 1)
+                position += len(block)
+        starts = np.concatenate(starts)
+        # A final line break does not start another line
+        if starts[-1] == self.size:
+            starts = starts[:-1]
+        self.offsets = np.append(starts, self.size)
+
+    def is_current(self, stat):
+        return stat.st_mtime == self.mtime and stat.st_size == self.size
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def range_bytes(self, start_line, end_line):
+        return int(self.offsets[end_line] - self.offsets[start_line - 1])
+
+    # Lines start_line to end_line (starting at 1, both included) as one string
+    def read_lines(self, start_line, end_line):
+        with open(self.filepath, "rb") as f:
+            f.seek(int(self.offsets[start_line - 1]))
+            return f.read(self.range_bytes(start_line, end_line)).decode("utf-8")
+
+    # (start_line, end_line) of the page, None past the end of the file. Consecutive lines are added
+    # to a page while their tokens fit in page_tokens; a single longer line is a page on its own.
+    def page(self, page_number, page_tokens):
+        with self.lock:
+            starts = self.pages.setdefault(page_tokens, [1])
+            while len(starts) <= page_number and starts[-1] <= len(self):
+                starts.append(self.next_page_start(starts[-1], page_tokens))
+            if page_number > len(starts) - 1:
+                return None
+            return starts[page_number - 1], starts[page_number] - 1
+
+    def next_page_start(self, start_line, page_tokens):
+        # Only the lines in a window of about PAGE_TOKEN_BYTES bytes per token are tokenized, so a
+        # page can end before page_tokens on text with long tokens
+        end_line = int(np.searchsorted(self.offsets, self.offsets[start_line - 1] + page_tokens * PAGE_TOKEN_BYTES, side="right")) - 1
+        end_line = min(max(end_line, start_line), len(self))
+        text = self.read_lines(start_line, end_line)
+        lines = [line + "\n" for line in text.split("\n")]
+        if text.endswith("\n"):
+            lines.pop()
+        tokens = 0
+        for i, line_tokens in enumerate(count_tokens_many(lines)):
+            tokens += line_tokens
+            if tokens > page_tokens and i > 0:
+                return start_line + i
+        return start_line + len(lines)
+
+    # Text of the page, a line longer than page_tokens is truncated
+    def read_page(self, page_number, page_tokens):
+        bounds = self.page(page_number, page_tokens)
+        if bounds is None:
+            return None, None
+        text = self.read_lines(*bounds)
+        if bounds[0] == bounds[1]:
+            text = truncate_tokens(text, page_tokens)
+        return bounds, text
+
+line_indexes = OrderedDict()
+line_indexes_lock = threading.Lock()
+
+# Line index of the file, rebuilt when the file changes
+def get_line_index(filepath):
+    stat = os.stat(filepath)
+    with line_indexes_lock:
+        index = line_indexes.get(filepath)
+        if index is not None and index.is_current(stat):
+            line_indexes.move_to_end(filepath)
+            return index
+    index = LineIndex(filepath)
+    with line_indexes_lock:
+        line_indexes[filepath] = index
+        line_indexes.move_to_end(filepath)
+        while len(line_indexes) > MAX_LINE_INDEXES:
+            line_indexes.popitem(last=False)
+    return index
@@ -1,11 +1,13 @@
 import os
 from agents.tools import Tool, Parameter
-from llm import count_tokens
+from llm import exceeds_token_limit
+from .file_index import get_file_index
 
 MAX_TOKENS = 1000
 
 class ListDirectory(Tool):
-    def __init__(self):
+    def __init__(self, index=None):
+        self.index = index or get_file_index()
         super().__init__(
             name="list_directory",
             func=self.list_directory,
@@ -30,19 +32,18 @@ class ListDirectory(Tool):
             def get_tree(path, depth):
                 tree = {}
                 if depth < 0: return tree
-                for name in os.listdir(path):
-                    sub_path = os.path.join(path, name)
-                    if os.path.isdir(sub_path):
-                        tree[name + "/"] = get_tree(sub_path, depth - 1)
-                    else:
-                        tree[name] = None
+                # Listings come from the shared file index, unchanged directories are not read again
+                dirnames, filenames = self.index.list_dir(path)
+                for name in dirnames:
+                    tree[name + "/"] = get_tree(os.path.join(path, name), depth - 1)
+                for name in filenames:
+                    tree[name] = None
                 return tree
 
             tree = get_tree(path, depth)
             tree_string = f"Here is the directory:\n{print_tree(tree)}"
 
-            tokens_count = count_tokens(tree_string)
-            if tokens_count > MAX_TOKENS:
+            if exceeds_token_limit(tree_string, MAX_TOKENS):
                 return "The string containing the list of files and directories is too large, try different depth or another path."
 
             return tree_string
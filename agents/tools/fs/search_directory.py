@@ -1,12 +1,14 @@
-import os
 import re
+from itertools import islice
 from agents.tools import Tool, Parameter
-from llm import count_tokens
+from llm import exceeds_token_limit
+from .file_index import get_file_index
 
 MAX_TOKENS = 1500
 
 class SearchDirectory(Tool):
-    def __init__(self):
+    def __init__(self, index=None):
+        self.index = index or get_file_index()
         super().__init__(
             name="search_directory",
             func=self.search_directory,
@@ -25,37 +27,27 @@ class SearchDirectory(Tool):
                 re.compile(regex)
             except re.error:
                 return "ERROR: Invalid regular expression"
-            
-        # Create a list of all the filepaths inside the ./data directory
-        matches = []
-        for root, dirnames, filenames in os.walk("./data"):
-            for filename in filenames:
-                # Append the filepath to the list of matches. Change \ for /
-                matches.append(os.path.join(root, filename).replace("\\", "/"))
-            
-        # If regex is provided, filter the matches
-        if regex:
-            pattern = re.compile(regex)
-            matches = [match for match in matches if pattern.search(match)]
-        
-        # Use pagination
+
+        # Total number of matches, cached by the file index until ./data changes
+        total = self.index.count(regex)
+
+        # Use pagination, the matches are filtered lazily and the walk stops once the page is filled
         start = (page_number - 1) * page_size
         end = start + page_size
 
         # Return the matches in the requested page
-        page_matches = matches[start:end]
+        page_matches = list(islice(self.index.search(regex), start, end))
 
         # Error handling for no matches
         if len(page_matches) == 0:
             return f"No matches found for the given regex {regex}."
 
-        return_string = f"Search results (page {page_number} of {len(matches) // page_size + 1}):\n"
+        return_string = f"Search results (page {page_number} of {total // page_size + 1}):\n"
         for file in page_matches:
             return_string += f"- {file}\n"
 
         # Check for token count limit
-        token_count = count_tokens(return_string)
-        if token_count > MAX_TOKENS:
+        if exceeds_token_limit(return_string, MAX_TOKENS):
             return "ERROR: The return string is too long. Please try again with a smaller page size."
 
-        return f"Search results: {len(page_matches)} matches:\n{return_string}"
\ No newline at end of file
+        return f"Search results: {len(page_matches)} matches:\n{return_string}"
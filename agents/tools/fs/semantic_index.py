@@ -0,0 +1,198 @@
+import hashlib
+import json
+import os
+import threading
+import numpy as np
+from agents.memory.embedding_store import MappedEmbeddingStore, top_k
+from .file_index import get_file_index
+from llm import count_tokens_many, generate_embeddings, generate_embeddings_batch, truncate_tokens
+
+TEXT_EXTENSIONS = ('.txt', '.md', '.yaml', '.yml', '.conf', '.ini', '.html', '.css', '.js', '.py', '.java', '.c', '.cpp', '.ts', '.php', '.rb', '.go', '.rs', '.h', '.hpp', '.cs', '.swift', '.kt', '.scala', '.m', '.pl', '.bash', '.sh', '.r', '.groovy', '.clj', '.sql', '.properties', '.bat', '.ps1', '.vbs', '.lua', '.rst', '.markdown', '.tex', '.asm', '.mat', '.f', '.pas', '.vb', '.dart', '.sass', '.less', '.scss', '.erl', '.hs', '.aspx', '.jsp', '.phtml', '.twig', '.mustache', '.haml', '.jl', '.cshtml', '.vbhtml', '.fs', '.fsx', '.ml', '.tcl', '.zsh', '.csh', '.jsx', '.tsx')
+SKIP_DIRECTORIES = {".git", "node_modules", "__pycache__", ".venv", "venv"}
+
+# Files are indexed in chunks of consecutive lines of up to CHUNK_TOKENS tokens,
+# consecutive chunks share OVERLAP_LINES lines
+CHUNK_TOKENS = 400
+OVERLAP_LINES = 5
+# Larger files are not indexed
+MAX_FILE_BYTES = 512 * 1024
+# Longest text sent to the embedding model
+EMBEDDING_MAX_TOKENS = 8000
+
+# Lines of the text with their line breaks. Only "\n" breaks a line, as in the line numbers of the
+# other file tools; str.splitlines also breaks on \r, \x0b, \x0c, \x1c-\x1e, \x85, \u2028 and \u2029.
+def split_lines(text):
+    lines = [line + "\n" for line in text.split("\n")]
+    lines[-1] = lines[-1][:-1]
+    if not lines[-1]:
+        lines.pop()
+    return lines
+
+# Semantic index of the text files under `root`. Chunk embeddings are kept in a float32 file
+# mapped into memory and the chunk list (path and line range of every row) in a JSON file.
+# update() only re-embeds the files whose mtime/size and content hash changed; the rows of
+# changed or deleted files are left as holes and the file is compacted when half of it is holes.
+class WorkspaceIndex:
+    def __init__(self, root="./data", path="./cache/semantic_index", chunk_tokens=CHUNK_TOKENS, overlap_lines=OVERLAP_LINES):
+        self.root = root
+        self.path = path
+        self.chunk_tokens = chunk_tokens
+        self.overlap_lines = overlap_lines
+        self.meta_file = os.path.join(path, "index.json")
+        self.embeddings_file = os.path.join(path, "embeddings.f32")
+        self.lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        self.load()
+
+    def load(self):
+        self.files = {}
+        self.chunks = []
+        if os.path.exists(self.meta_file):
+            with open(self.meta_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.files = data["files"]
+            self.chunks = data["chunks"]
+        self.embeddings = MappedEmbeddingStore(self.embeddings_file, size=len(self.chunks))
+        if len(self.embeddings) != len(self.chunks):
+            self.reset()
+
+    def save(self):
+        self.embeddings.flush()
+        tmp_file = self.meta_file + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump({"files": self.files, "chunks": self.chunks}, f)
+        os.replace(tmp_file, self.meta_file)
+
+    def reset(self):
+        self.embeddings.clear()
+        self.files = {}
+        self.chunks = []
+
+    def iter_files(self):
+        for filepath in get_file_index(self.root).iter_files(skip_dirs=SKIP_DIRECTORIES):
+            if filepath.endswith(TEXT_EXTENSIONS):
+                yield filepath
+
+    def update(self):
+        with self.lock:
+            seen = set()
+            changed = []
+            dirty = False
+            for filepath in self.iter_files():
+                seen.add(filepath)
+                try:
+                    stat = os.stat(filepath)
+                except OSError:
+                    continue
+                entry = self.files.get(filepath)
+                if entry and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+                    continue
+                if stat.st_size > MAX_FILE_BYTES:
+                    seen.discard(filepath)
+                    continue
+                with open(filepath, "rb") as f:
+                    data = f.read()
+                digest = hashlib.sha256(data).hexdigest()
+                if entry and entry["sha256"] == digest:
+                    # Touched but not modified
+                    entry.update(mtime=stat.st_mtime, size=stat.st_size)
+                    dirty = True
+                    continue
+                try:
+                    text = data.decode("utf-8")
+                except UnicodeDecodeError:
+                    seen.discard(filepath)
+                    continue
+                changed.append((filepath, stat, digest, text))
+
+            removed = [filepath for filepath in self.files if filepath not in seen]
+            for filepath in removed + [filepath for filepath, _, _, _ in changed]:
+                self.remove_file(filepath)
+
+            new_chunks = []
+            for filepath, _, _, text in changed:
+                new_chunks.extend((filepath, *chunk) for chunk in self.chunk_text(text))
+            embeddings = []
+            if new_chunks:
+                # Only a single very long line can go over the embedding model limit
+                texts = [
+                    truncate_tokens(f"{filepath}\n{chunk}", EMBEDDING_MAX_TOKENS) if tokens > EMBEDDING_MAX_TOKENS else f"{filepath}\n{chunk}"
+                    for filepath, _, _, chunk, tokens in new_chunks
+                ]
+                embeddings = generate_embeddings_batch(texts)
+
+            # Files are registered once their embeddings exist, so if the batch fails they are
+            # indexed again on the next update
+            for filepath, stat, digest, _ in changed:
+                self.files[filepath] = {"mtime": stat.st_mtime, "size": stat.st_size, "sha256": digest, "rows": []}
+            for (filepath, start_line, end_line, _, _), embedding in zip(new_chunks, embeddings):
+                self.files[filepath]["rows"].append(self.embeddings.add(embedding))
+                self.chunks.append([filepath, start_line, end_line])
+
+            if self.chunks and self.chunks.count(None) * 2 > len(self.chunks):
+                self.compact()
+            if changed or removed or dirty:
+                self.save()
+            return {"updated_files": len(changed), "removed_files": len(removed), "new_chunks": len(new_chunks)}
+
+    def remove_file(self, filepath):
+        entry = self.files.pop(filepath, None)
+        if entry:
+            for row in entry["rows"]:
+                self.chunks[row] = None
+
+    # Rewrites the embeddings file without the rows of changed or deleted files
+    def compact(self):
+        live_rows = [row for row, chunk in enumerate(self.chunks) if chunk is not None]
+        vectors = np.array(self.embeddings.vectors()[live_rows])
+        chunks = [self.chunks[row] for row in live_rows]
+        self.embeddings.clear()
+        self.chunks = []
+        for entry in self.files.values():
+            entry["rows"] = []
+        for vector, chunk in zip(vectors, chunks):
+            self.files[chunk[0]]["rows"].append(self.embeddings.add(vector))
+            self.chunks.append(chunk)
+
+    # Yields (start_line, end_line, text, tokens) chunks, line numbers start at 1
+    def chunk_text(self, text):
+        lines = split_lines(text)
+        if not lines:
+            return
+        token_counts = count_tokens_many(lines)
+        start = 0
+        while start < len(lines):
+            end = start
+            tokens = 0
+            while end < len(lines) and (end == start or tokens + token_counts[end] <= self.chunk_tokens):
+                tokens += token_counts[end]
+                end += 1
+            chunk = "".join(lines[start:end])
+            if chunk.strip():
+                yield start + 1, end, chunk, tokens
+            if end == len(lines):
+                break
+            start = max(start + 1, end - self.overlap_lines)
+
+    # The k chunks most similar to the query, as dicts with path, start_line, end_line and score
+    def search(self, query, k=5):
+        with self.lock:
+            if not any(chunk is not None for chunk in self.chunks):
+                return []
+            similarities = np.array(self.embeddings.similarities(generate_embeddings(query)))
+            similarities[[row for row, chunk in enumerate(self.chunks) if chunk is None]] = -np.inf
+            live = len(self.chunks) - self.chunks.count(None)
+            return [
+                {"path": self.chunks[row][0], "start_line": self.chunks[row][1], "end_line": self.chunks[row][2], "score": float(similarities[row])}
+                for row in top_k(similarities, min(k, live))
+            ]
+
+workspace_indexes = {}
+workspace_indexes_lock = threading.Lock()
+
+# Shared index of a root, so every SemanticSearch tool uses the same index and lock
+def get_workspace_index(root="./data"):
+    with workspace_indexes_lock:
+        if root not in workspace_indexes:
+            workspace_indexes[root] = WorkspaceIndex(root)
+        return workspace_indexes[root]
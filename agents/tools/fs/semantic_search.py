@@ -0,0 +1,44 @@
+from agents.tools import Tool, Parameter
+from llm import exceeds_token_limit
+from .semantic_index import get_workspace_index, split_lines
+
+MAX_TOKENS = 2000
+
+class SemanticSearch(Tool):
+    def __init__(self, index=None):
+        self.index = index or get_workspace_index()
+        super().__init__(
+            name="semantic_search",
+            func=self.semantic_search,
+            description="Search the text files in the ./data directory by meaning. Returns the file fragments most related to a natural language query, with their paths and line numbers.",
+            arguments=[
+                Parameter("query", "A natural language description of what you are looking for.", str, required=True),
+                Parameter("top_k", "The number of fragments to return. Default=5.", int, required=False)
+            ]
+        )
+
+    def semantic_search(self, query, top_k=5):
+        if not query:
+            return "ERROR: Missing argument. Query is required."
+
+        # Picks up the files added or modified since the last search
+        self.index.update()
+        results = self.index.search(query, top_k)
+        if not results:
+            return "No indexed files found in ./data."
+
+        return_string = f"Search results for '{query}':\n"
+        for result in results:
+            try:
+                # Split as when indexing, so the line numbers match
+                with open(result["path"], "r", encoding="utf-8", newline="") as infile:
+                    lines = split_lines(infile.read())[result["start_line"] - 1:result["end_line"]]
+            except (IOError, UnicodeDecodeError):
+                continue
+            fragment = f"- {result['path']} (lines {result['start_line']}-{result['end_line']}, score {result['score']:.2f}):\n'''\n{''.join(lines)}\n'''\n"
+            # Keep the best fragments that fit in the token limit
+            if exceeds_token_limit(return_string + fragment, MAX_TOKENS):
+                break
+            return_string += fragment
+
+        return return_string
@@ -0,0 +1,231 @@
+import json
+import os
+import re
+import sys
+import threading
+from functools import lru_cache
+try:
+    from re import _parser as sre_parse
+    from re._casefix import _EXTRA_CASES as IGNORECASE_FIXES
+except ImportError:
+    # Python 3.10
+    import sre_parse
+    from sre_compile import _ignorecase_fixes as IGNORECASE_FIXES
+from .file_index import get_file_index
+from .semantic_index import TEXT_EXTENSIONS, SKIP_DIRECTORIES, MAX_FILE_BYTES
+
+# Indexes written with a different version are rebuilt
+INDEX_VERSION = 2
+
+# Trigram inverted index of the text files under `root`, to narrow the files a regex has to be run
+# on. Trigrams are taken from the case folded text, so the candidates are a superset of the files
+# that can match, also for case insensitive patterns. The posting lists are kept in a JSON file;
+# update() only reads the files whose mtime/size changed, the ids of changed or deleted files are
+# dropped from the posting lists when half of the ids are dead. Files over MAX_FILE_BYTES are not
+# indexed, they are always candidates and are scanned by grep.
+class TrigramIndex:
+    def __init__(self, root="./data", path="./cache/trigram_index"):
+        self.root = root.rstrip("/")
+        self.path = path
+        self.index_file = os.path.join(path, "index.json")
+        self.lock = threading.RLock()
+        os.makedirs(path, exist_ok=True)
+        self.load()
+
+    def load(self):
+        self.files = {}
+        self.postings = {}
+        self.next_id = 0
+        self.dead_ids = 0
+        self.large_files = set()
+        if os.path.exists(self.index_file):
+            with open(self.index_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        else:
+            data = {}
+        if data.get("version") == INDEX_VERSION:
+            self.files = data["files"]
+            self.postings = {trigram: set(ids) for trigram, ids in data["postings"].items()}
+            self.next_id = data["next_id"]
+            self.dead_ids = data["dead_ids"]
+            self.large_files = set(data["large_files"])
+        self.paths = {entry["id"]: filepath for filepath, entry in self.files.items()}
+
+    def save(self):
+        tmp_file = self.index_file + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump({
+                "version": INDEX_VERSION,
+                "files": self.files,
+                "postings": {trigram: sorted(ids) for trigram, ids in self.postings.items()},
+                "next_id": self.next_id,
+                "dead_ids": self.dead_ids,
+                "large_files": sorted(self.large_files)
+            }, f)
+        os.replace(tmp_file, self.index_file)
+
+    def iter_files(self, path=None):
+        for filepath in get_file_index(self.root).iter_files(path, skip_dirs=SKIP_DIRECTORIES):
+            if filepath.endswith(TEXT_EXTENSIONS):
+                yield filepath
+
+    # Indexes the files added or modified under `path` (default: the whole root) and forgets the
+    # deleted ones
+    def update(self, path=None):
+        path = (path or self.root).rstrip("/")
+        with self.lock:
+            seen = set()
+            large_files = set()
+            changed = 0
+            for filepath in self.iter_files(path):
+                try:
+                    stat = os.stat(filepath)
+                except OSError:
+                    continue
+                if stat.st_size > MAX_FILE_BYTES:
+                    large_files.add(filepath)
+                    continue
+                seen.add(filepath)
+                entry = self.files.get(filepath)
+                if entry and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+                    continue
+                try:
+                    with open(filepath, "r", encoding="utf-8") as f:
+                        text = f.read()
+                except (OSError, UnicodeDecodeError):
+                    seen.discard(filepath)
+                    continue
+                self.remove_file(filepath)
+                self.add_file(filepath, stat, text)
+                changed += 1
+
+            prefix = path + "/"
+            removed = [filepath for filepath in self.files if filepath.startswith(prefix) and filepath not in seen]
+            for filepath in removed:
+                self.remove_file(filepath)
+            previous_large_files = {filepath for filepath in self.large_files if filepath.startswith(prefix)}
+            self.large_files = (self.large_files - previous_large_files) | large_files
+
+            if self.dead_ids * 2 > len(self.files) + self.dead_ids:
+                self.compact()
+            if changed or removed or large_files != previous_large_files:
+                self.save()
+            return {"updated_files": changed, "removed_files": len(removed)}
+
+    def add_file(self, filepath, stat, text):
+        file_id = self.next_id
+        self.next_id += 1
+        self.files[filepath] = {"id": file_id, "mtime": stat.st_mtime, "size": stat.st_size}
+        self.paths[file_id] = filepath
+        for trigram in trigrams(fold_case(text)):
+            self.postings.setdefault(trigram, set()).add(file_id)
+
+    def remove_file(self, filepath):
+        entry = self.files.pop(filepath, None)
+        if entry:
+            del self.paths[entry["id"]]
+            self.dead_ids += 1
+
+    # Drops the ids of changed or deleted files from the posting lists
+    def compact(self):
+        postings = {}
+        for trigram, ids in self.postings.items():
+            ids = {file_id for file_id in ids if file_id in self.paths}
+            if ids:
+                postings[trigram] = ids
+        self.postings = postings
+        self.dead_ids = 0
+
+    # Paths of the files that can contain a match of the regex, sorted: the indexed files with every
+    # required trigram and the files too large to be indexed
+    def candidates(self, regex):
+        with self.lock:
+            required = regex_trigrams(regex)
+            if not required:
+                return sorted(set(self.files) | self.large_files)
+            # Intersect the shortest posting lists first
+            ids = None
+            for trigram in sorted(required, key=lambda trigram: len(self.postings.get(trigram, ()))):
+                ids = set(self.postings.get(trigram, ())) if ids is None else ids & self.postings.get(trigram, set())
+                if not ids:
+                    break
+            return sorted({self.paths[file_id] for file_id in ids if file_id in self.paths} | self.large_files)
+
+    # Lazily yields the matching lines as dicts with path, line (starting at 1) and context: the
+    # (line number, text) pairs of the `context_lines` lines around the match
+    def grep(self, regex, context_lines=0):
+        pattern = re.compile(regex)
+        for filepath in self.candidates(regex):
+            try:
+                with open(filepath, "r", encoding="utf-8") as f:
+                    lines = [line.rstrip("\r\n") for line in f]
+            except (OSError, UnicodeDecodeError):
+                continue
+            for i, line in enumerate(lines):
+                if pattern.search(line):
+                    start = max(0, i - context_lines)
+                    end = min(len(lines), i + context_lines + 1)
+                    yield {"path": filepath, "line": i + 1, "context": [(j + 1, lines[j]) for j in range(start, end)]}
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+# Maps every character to one representative of the characters a case insensitive regex matches
+# it with: the same simple lowercase, or one of the extra cases of re (e.g. ſ and s, ı and i),
+# which str.lower() does not join
+@lru_cache(maxsize=None)
+def case_fold_table():
+    table = {}
+    for code in range(sys.maxunicode + 1):
+        lower = chr(code).lower()[0]
+        if lower != chr(code):
+            table[code] = lower
+    for lower, extra in IGNORECASE_FIXES.items():
+        representative = chr(min(lower, *extra))
+        for code in (lower, *extra):
+            table[code] = representative
+    for code, lower in table.items():
+        if ord(lower) in IGNORECASE_FIXES:
+            table[code] = table[ord(lower)]
+    return table
+
+def fold_case(text):
+    return text.translate(case_fold_table())
+
+# Trigrams every match of the regex must contain, from the runs of literal characters that are
+# always part of a match. Alternations, optional parts and character classes break the runs.
+def regex_trigrams(regex):
+    try:
+        parsed = sre_parse.parse(regex)
+    except re.error:
+        return set()
+    required = set()
+    for literal in required_literals(parsed):
+        required |= trigrams(fold_case(literal))
+    return required
+
+def required_literals(parsed):
+    literals = []
+    run = ""
+    for op, value in parsed:
+        if op is sre_parse.LITERAL:
+            run += chr(value)
+            continue
+        literals.append(run)
+        run = ""
+        if op is sre_parse.SUBPATTERN:
+            literals.extend(required_literals(value[-1]))
+        elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) and value[0] >= 1:
+            literals.extend(required_literals(value[2]))
+    literals.append(run)
+    return [literal for literal in literals if len(literal) >= 3]
+
+trigram_indexes = {}
+trigram_indexes_lock = threading.Lock()
+
+# Shared index of a root, so the tools that add files (e.g. CloneRepo) can update it
+def get_trigram_index(root="./data"):
+    with trigram_indexes_lock:
+        if root not in trigram_indexes:
+            trigram_indexes[root] = TrigramIndex(root)
+        return trigram_indexes[root]
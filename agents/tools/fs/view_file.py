@@ -1,20 +1,29 @@
-from agents.tools import Tool, Parameter
-from llm import count_tokens
+import os
+from agents.tools import Tool, Parameter, file_cache
+from llm import exceeds_token_limit
+from .line_index import get_line_index
 
 MAX_TOKENS = 2000
+# Tokens of file content in every page, the rest is left for the page header
+PAGE_TOKENS = 1900
+# Larger files are viewed by pages and larger line ranges are rejected, without reading them whole
+MAX_READ_BYTES = 64 * 1024
 
 class ViewFile(Tool):
     def __init__(self):
         super().__init__(
             name="view_file",
             func=self.view_file,
-            description="Useful for viewing the content of a text file, considering a max tokens limit.",
+            description="Useful for viewing the content of a text file, considering a max tokens limit. Large files can be viewed by pages or by ranges of lines.",
             arguments=[
                 Parameter("filepath", "The path to the text file you want to view. Must start with './data'", str, required=True),
+                Parameter("start_line", "First line to view, starting at 1. Use it with end_line to view a range of lines of a large file.", int, required=False),
+                Parameter("end_line", "Last line to view (included). Default=the end of the file.", int, required=False),
+                Parameter("page_number", "The page of the file to view, for files too large to view at once. Default=1.", int, required=False)
             ]
         )
 
-    def view_file(self, filepath):
+    def view_file(self, filepath, start_line=None, end_line=None, page_number=None):
         if filepath is None:
             return "ERROR: Missing argument. Filepath is required."
         
@@ -28,8 +37,20 @@ class ViewFile(Tool):
             return f"ERROR: Invalid file extension. Allowed extensions are {allowed_extensions}"
 
         try:
-            with open(filepath, 'r', encoding="utf-8") as infile:
-                file_content = infile.read()
+            if start_line is None and end_line is None and page_number is None and os.path.getsize(filepath) <= MAX_READ_BYTES:
+                # Content and token count are cached until the file changes
+                cached = file_cache.get(filepath)
+                # Every token has at least one byte, the content is only tokenized when its size is not conclusive
+                if cached.size <= MAX_TOKENS or cached.tokens <= MAX_TOKENS:
+                    return cached.content
+
+            # Byte offsets of the lines, cached until the file changes
+            line_index = get_line_index(filepath)
+            if start_line is not None or end_line is not None:
+                return self.view_lines(line_index, 1 if start_line is None else start_line, len(line_index) if end_line is None else end_line)
+
+            # Files too large to view at once are viewed by pages
+            return self.view_page(line_index, 1 if page_number is None else page_number)
         except FileNotFoundError:
             return "ERROR: File not found"
         except IOError as e:
@@ -37,10 +58,31 @@ class ViewFile(Tool):
         except Exception as e:
             return f"ERROR: {e}"
 
-        # Count tokens in file_content
-        tokens_count = count_tokens(file_content)
-        
-        if tokens_count > MAX_TOKENS:
-            return "ERROR: The string containing the file content is too large, try a different file or a different tool."
-        
-        return file_content
\ No newline at end of file
+    def view_lines(self, line_index, start_line, end_line):
+        n_lines = len(line_index)
+        if start_line > n_lines:
+            return f"ERROR: The file has only {n_lines} lines."
+        if not 1 <= start_line <= end_line:
+            return "ERROR: Invalid line range. start_line must be at least 1 and not greater than end_line."
+        end_line = min(end_line, n_lines)
+
+        too_large = f"ERROR: The lines {start_line}-{end_line} are too large, try a smaller range or page_number."
+        if line_index.range_bytes(start_line, end_line) > MAX_READ_BYTES:
+            return too_large
+        file_content = line_index.read_lines(start_line, end_line)
+        if exceeds_token_limit(file_content, PAGE_TOKENS):
+            return too_large
+
+        return f"Lines {start_line}-{end_line} of {n_lines}:\n{file_content}"
+
+    def view_page(self, line_index, page_number):
+        if page_number < 1:
+            return "ERROR: Invalid page number. page_number must be at least 1."
+        bounds, file_content = line_index.read_page(page_number, PAGE_TOKENS)
+        if bounds is None:
+            return f"ERROR: Page {page_number} is past the end of the file ({len(line_index)} lines)."
+
+        start_line, end_line = bounds
+        n_lines = len(line_index)
+        next_page = f", use page_number={page_number + 1} to view the next lines" if end_line < n_lines else ""
+        return f"Page {page_number}, lines {start_line}-{end_line} of {n_lines}{next_page}:\n{file_content}"
@@ -3,4 +3,5 @@ from .create_issue import CreateIssue
 from .get_repositories import GetRepositories
 from .get_user_info import GetUserInfo
 from .get_issues import GetIssues
-from .get_issue_details import GetIssueDetails
\ No newline at end of file
+from .get_issue_details import GetIssueDetails
+from .client import GitHubClient, GitHubCache, get_github_client
\ No newline at end of file
@@ -0,0 +1,188 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from utils import Logger, span
+from utils.sqlite_cache import SQLiteCache
+
+from dotenv import load_dotenv
+load_dotenv()
+
+# Body of a 200 response served from the cache after a 304 Not Modified
+class CachedResponse:
+    def __init__(self, url, text, headers):
+        self.url = url
+        self.status_code = 200
+        self.text = text
+        self.headers = headers
+        self.from_cache = True
+
+    def json(self):
+        return json.loads(self.text)
+
+# GET responses with an ETag or Last-Modified, keyed by (sha256 of the token, url), in an
+# in-memory LRU and in SQLite so the cache survives restarts
+class GitHubCache(SQLiteCache):
+    def __init__(self, path=None, max_items=1000):
+        super().__init__(path, "responses", "token TEXT, url TEXT, etag TEXT, last_modified TEXT, body TEXT, PRIMARY KEY (token, url)", max_items)
+
+    def get(self, token_hash, url):
+        key = (token_hash, url)
+        with self.lock:
+            entry = self.recall(key)
+            if entry is not None:
+                return entry
+            db = self.connect()
+            if db is not None:
+                row = db.execute("SELECT etag, last_modified, body FROM responses WHERE token = ? AND url = ?", key).fetchone()
+                if row:
+                    entry = {"etag": row[0], "last_modified": row[1], "body": row[2]}
+                    self.remember(key, entry)
+                    return entry
+            return None
+
+    def put(self, token_hash, url, etag, last_modified, body):
+        key = (token_hash, url)
+        entry = {"etag": etag, "last_modified": last_modified, "body": body}
+        with self.lock:
+            self.remember(key, entry)
+            db = self.connect()
+            if db is not None:
+                db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)", (*key, etag, last_modified, body))
+                db.commit()
+
+# Client shared by the GitHub tools. One keep-alive session with a connection pool, so the TLS
+# handshake is not repeated on every call. GETs are sent with If-None-Match/If-Modified-Since
+# when the response is cached, a 304 is answered from the cache and does not count against the
+# rate limit. When the X-RateLimit-* headers say the limit is exhausted, requests wait for the
+# reset (at most max_wait seconds) and are retried.
+class GitHubClient:
+    def __init__(self, token=None, base_url=None, cache=None, pool_size=8, max_retries=3, max_wait=60.0, timeout=30.0):
+        self.token = token or os.getenv("GITHUB_PAT")
+        self.base_url = (base_url or os.getenv("GITHUB_API_URL") or "https://api.github.com").rstrip("/")
+        self.cache = cache if cache is not None else GitHubCache(os.getenv("GITHUB_CACHE_PATH", "./cache/github.db"))
+        self.max_retries = max_retries
+        self.max_wait = max_wait
+        self.timeout = timeout
+        self.log = Logger(name="github")
+        self.token_hash = hashlib.sha256((self.token or "").encode("utf-8")).hexdigest()
+        self.lock = threading.Lock()
+        # Last X-RateLimit-Remaining and X-RateLimit-Reset seen
+        self.rate_limit_remaining = None
+        self.rate_limit_reset = None
+        self.hits = 0
+        self.misses = 0
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"Accept": "application/vnd.github+json"})
+        if self.token:
+            self.session.headers["Authorization"] = f"token {self.token}"
+
+    def url(self, path):
+        return path if path.startswith(("http://", "https://")) else f"{self.base_url}/{path.lstrip('/')}"
+
+    def get(self, path, params=None):
+        return self.request("GET", path, params=params)
+
+    def post(self, path, json=None):
+        return self.request("POST", path, json=json)
+
+    def request(self, method, path, params=None, json=None):
+        url = self.url(path)
+        if params:
+            url = requests.Request(method, url, params=params).prepare().url
+        with span("github.request", method=method, url=url) as request_span:
+            cached = self.cache.get(self.token_hash, url) if method == "GET" else None
+            headers = {}
+            if cached:
+                if cached["etag"]:
+                    headers["If-None-Match"] = cached["etag"]
+                if cached["last_modified"]:
+                    headers["If-Modified-Since"] = cached["last_modified"]
+
+            for attempt in range(self.max_retries + 1):
+                self.wait_for_rate_limit()
+                response = self.session.request(method, url, headers=headers, json=json, timeout=self.timeout)
+                self.update_rate_limit(response)
+                wait = self.retry_wait(response)
+                if wait is None or attempt == self.max_retries:
+                    break
+                request_span.increment("retries")
+                self.log.warn(f"GitHub rate limit reached on {method} {url}, retrying in {wait:.0f} seconds")
+                time.sleep(wait)
+
+            request_span.set_attribute("status", response.status_code)
+            if response.status_code == 304 and cached:
+                with self.lock:
+                    self.hits += 1
+                request_span.set_attribute("cached", True)
+                return CachedResponse(url, cached["body"], response.headers)
+            if method == "GET":
+                with self.lock:
+                    self.misses += 1
+                if response.status_code == 200 and (response.headers.get("ETag") or response.headers.get("Last-Modified")):
+                    self.cache.put(self.token_hash, url, response.headers.get("ETag"), response.headers.get("Last-Modified"), response.text)
+            return response
+
+    def update_rate_limit(self, response):
+        remaining = response.headers.get("X-RateLimit-Remaining")
+        reset = response.headers.get("X-RateLimit-Reset")
+        if remaining is not None and reset is not None:
+            with self.lock:
+                self.rate_limit_remaining = int(remaining)
+                self.rate_limit_reset = float(reset)
+
+    # Seconds to wait before retrying a rate limited response, None if it is not rate limited or
+    # the wait is longer than max_wait
+    def retry_wait(self, response):
+        if response.status_code not in (403, 429):
+            return None
+        retry_after = response.headers.get("Retry-After")
+        if retry_after is not None and retry_after.isdigit():
+            wait = float(retry_after)
+        elif response.headers.get("X-RateLimit-Remaining") == "0" and response.headers.get("X-RateLimit-Reset"):
+            wait = max(float(response.headers["X-RateLimit-Reset"]) - time.time(), 0) + 1
+        else:
+            return None
+        return wait if wait <= self.max_wait else None
+
+    # Waits for the reset when the last response said no requests are left
+    def wait_for_rate_limit(self):
+        with self.lock:
+            remaining, reset = self.rate_limit_remaining, self.rate_limit_reset
+        if remaining != 0 or reset is None:
+            return
+        wait = reset - time.time() + 1
+        if 0 < wait <= self.max_wait:
+            self.log.warn(f"GitHub rate limit exhausted, waiting {wait:.0f} seconds for the reset")
+            time.sleep(wait)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "rate_limit_remaining": self.rate_limit_remaining,
+                "rate_limit_reset": self.rate_limit_reset
+            }
+
+    def close(self):
+        self.session.close()
+
+github_client = None
+github_client_lock = threading.Lock()
+
+# Client shared by the GitHub tools, created on first use so importing the tools does not read
+# GITHUB_PAT or open the cache
+def get_github_client():
+    global github_client
+    with github_client_lock:
+        if github_client is None:
+            github_client = GitHubClient()
+        return github_client
@@ -1,12 +1,15 @@
 import os
 import subprocess
 from agents.tools import Tool, Parameter
+from agents.tools.fs.trigram_index import get_trigram_index
+from .client import get_github_client
 
 from dotenv import load_dotenv
 load_dotenv()
 
 class CloneRepo(Tool):
-    def __init__(self):
+    def __init__(self, client=None):
+        self.client = client or get_github_client()
         super().__init__(
             name="clone_repo",
             func=self.clone_repo,
@@ -17,8 +20,8 @@ class CloneRepo(Tool):
         )
 
     def clone_repo(self, repo_url):
-        # Get the PAT from environment variables
-        github_token = os.getenv('GITHUB_PAT')
+        # Get the PAT of the shared GitHub client
+        github_token = self.client.token
 
         # Modify the repo_url to include the PAT
         repo_url_parts = repo_url.split('://')  # separate the protocol from the rest of the URL
@@ -46,4 +49,7 @@ class CloneRepo(Tool):
         except OSError as e:
             return f"ERROR: Unable to create destination directory. Error message: {e}"
 
+        # Index the new repository now, so the next grep_files does not have to
+        get_trigram_index().update(destination)
+
         return f"Repository cloned successfully to {destination}"
\ No newline at end of file
@@ -1,12 +1,9 @@
-import os
-import requests
 from agents.tools import Tool, Parameter
-
-from dotenv import load_dotenv
-load_dotenv()
+from .client import get_github_client
 
 class CreateIssue(Tool):
-    def __init__(self):
+    def __init__(self, client=None):
+        self.client = client or get_github_client()
         super().__init__(
             name="create_issue",
             func=self.create_issue,
@@ -19,11 +16,9 @@ class CreateIssue(Tool):
         )
 
     def create_issue(self, repo, title, body):
-        github_token = os.getenv('GITHUB_PAT')
-        headers = {'Authorization': f'token {github_token}'}
         issue = {'title': title,
                  'body': body}
-        response = requests.post(f'https://api.github.com/repos/{repo}/issues', headers=headers, json=issue)
+        response = self.client.post(f'repos/{repo}/issues', json=issue)
 
         if response.status_code != 201:
             return f"ERROR: Unable to create issue. Response Message: {response.text}"
@@ -1,12 +1,9 @@
-import os
-import requests
 from agents.tools import Tool, Parameter
-from dotenv import load_dotenv
-
-load_dotenv()
+from .client import get_github_client
 
 class GetIssueDetails(Tool):
-    def __init__(self):
+    def __init__(self, client=None):
+        self.client = client or get_github_client()
         super().__init__(
             name="get_issue_details",
             func=self.get_issue_details,
@@ -18,9 +15,7 @@ class GetIssueDetails(Tool):
         )
 
     def get_issue_details(self, repo, issue_number):
-        github_token = os.getenv('GITHUB_PAT')
-        headers = {'Authorization': f'token {github_token}'}
-        response = requests.get(f'https://api.github.com/repos/{repo}/issues/{issue_number}', headers=headers)
+        response = self.client.get(f'repos/{repo}/issues/{issue_number}')
 
         if response.status_code != 200:
             return f"ERROR: Unable to retrieve issue details. Response Message: {response.text}"
@@ -1,12 +1,9 @@
-import os
-import requests
 from agents.tools import Tool, Parameter
-
-from dotenv import load_dotenv
-load_dotenv()
+from .client import get_github_client
 
 class GetIssues(Tool):
-    def __init__(self):
+    def __init__(self, client=None):
+        self.client = client or get_github_client()
         super().__init__(
             name="get_issues",
             func=self.get_repo_issues,
@@ -20,9 +17,7 @@ class GetIssues(Tool):
         )
 
     def get_repo_issues(self, repo, state='open', page_size=25, page_number=1):
-        github_token = os.getenv('GITHUB_PAT')
-        headers = {'Authorization': f'token {github_token}'}
-        response = requests.get(f'https://api.github.com/repos/{repo}/issues?state={state}', headers=headers)
+        response = self.client.get(f'repos/{repo}/issues', params={'state': state})
 
         if response.status_code != 200:
             return f"ERROR: Unable to retrieve repository's issues. Response Message: {response.text}"
@@ -1,12 +1,9 @@
-import os
-import requests
 from agents.tools import Tool, Parameter
-
-from dotenv import load_dotenv
-load_dotenv()
+from .client import get_github_client
 
 class GetRepositories(Tool):
-    def __init__(self):
+    def __init__(self, client=None):
+        self.client = client or get_github_client()
         super().__init__(
             name="get_repositories",
             func=self.get_user_repos,
@@ -18,9 +15,7 @@ class GetRepositories(Tool):
         )
 
     def get_user_repos(self, page_size=10, page_number=1):
-        github_token = os.getenv('GITHUB_PAT')
-        headers = {'Authorization': f'token {github_token}'}
-        response = requests.get(f'https://api.github.com/user/repos', headers=headers)
+        response = self.client.get('user/repos')
 
         if response.status_code != 200:
             return f"ERROR: Unable to retrieve user's repositories. Response Message: {response.text}"
@@ -1,12 +1,9 @@
-import os
-import requests
 from agents.tools import Tool
-
-from dotenv import load_dotenv
-load_dotenv()
+from .client import get_github_client
 
 class GetUserInfo(Tool):
-    def __init__(self):
+    def __init__(self, client=None):
+        self.client = client or get_github_client()
         super().__init__(
             name="get_user",
             func=self.get_user_profile,
@@ -15,9 +12,7 @@ class GetUserInfo(Tool):
         )
 
     def get_user_profile(self):
-        github_token = os.getenv('GITHUB_PAT')
-        headers = {'Authorization': f'token {github_token}'}
-        response = requests.get('https://api.github.com/user', headers=headers)
+        response = self.client.get('user')
 
         if response.status_code != 200:
             return f"ERROR: Unable to retrieve user's profile information. Response Message: {response.text}"
@@ -1,10 +1,30 @@
-from agents.tools import Tool, Parameter
-from llm import count_tokens, generate_text, gpt35_model, gpt35_16k_model, gpt4_model
+from agents.tools import Tool, Parameter, file_cache
+from llm import count_message_tokens, count_tokens_many, estimate_token_bounds, generate_text, generate_text_many, router, split_tokens, ContextLengthExceeded
 
-MAX_TOKENS = 8000
+# Tokens reserved for the answer when choosing the model
+ANSWER_TOKENS = 1000
+
+# Files that do not fit in one prompt are queried in chunks (map) and the partial answers
+# are combined (reduce). Chunks overlap so a passage split at a boundary is seen whole once.
+CHUNK_TOKENS = 2500
+CHUNK_OVERLAP_TOKENS = 200
+PARTIAL_ANSWER_TOKENS = 500
+# Partial answers combined by one reduce call, bigger sets are reduced in rounds
+REDUCE_INPUT_TOKENS = 8000
+NO_INFORMATION = "NO RELEVANT INFORMATION"
+
+SYSTEM_MESSAGE = {"role": "system", "content": "Review the [FILE_CONTENT] and answer the [QUERY]. Include as much details as possible in your answer."}
+MAP_SYSTEM_MESSAGE = {"role": "system", "content": f"Review the [FILE_CONTENT], which is one part of a larger file, and answer the [QUERY] using only this part. Include as much details as possible in your answer. If this part has no information relevant to the [QUERY], answer only {NO_INFORMATION}."}
+REDUCE_SYSTEM_MESSAGE = {"role": "system", "content": "The [PARTIAL_ANSWERS] answer the [QUERY] for different parts of the same file. Combine them into a single answer to the [QUERY], keeping every relevant detail and removing repetitions."}
 
 class QueryFile(Tool):
-    def __init__(self):
+    # model overrides the model chosen by the router
+    # max_parallel_chunks caps the concurrent chunk queries and max_chunks the size of the
+    # files that are queried in chunks (max_chunks * CHUNK_TOKENS tokens)
+    def __init__(self, model=None, max_parallel_chunks=4, max_chunks=40):
+        self.model = model
+        self.max_parallel_chunks = max_parallel_chunks
+        self.max_chunks = max_chunks
         super().__init__(
             name="query_file",
             func=self.query_file,
@@ -31,8 +51,9 @@ class QueryFile(Tool):
         query = "\n".join(questions)
 
         try:
-            with open(filepath, 'r', encoding="utf-8") as infile:
-                file_content = infile.read()
+            # Content, token count and chunks are cached until the file changes
+            cached = file_cache.get(filepath)
+            file_content = cached.content
         except FileNotFoundError:
             return "ERROR: File not found"
         except IOError as e:
@@ -40,18 +61,66 @@ class QueryFile(Tool):
         except Exception as e:
             return f"ERROR: {e}"
         
-        # Count tokens in file_content
-        tokens_count = count_tokens(file_content)
-        
-        if tokens_count > MAX_TOKENS:
+        # Files too large even for the chunked mode are rejected without tokenizing them
+        if estimate_token_bounds(file_content)[0] > self.max_chunks * CHUNK_TOKENS:
             return "ERROR: The string containing the file content is too large, try a different file or a different tool."
-        
-        if tokens_count > 2000:
-            model = gpt35_16k_model
-        else:
-            model = gpt35_model
-
-        system_message = {"role": "system", "content": "Review the [FILE_CONTENT] and answer the [QUERY]. Include as much details as possible in your answer."}
-        prompt = f"[QUERY]\n{query}\n[FILE_CONTENT]\n\'\'\'\n{file_content}\n'\'\'\n[ANSWER]"
-        answer = generate_text(prompt, model=model, messages=[system_message])
-        return answer
\ No newline at end of file
+
+        prompt = file_prompt(query, file_content)
+        # The file is tokenized once, only the rest of the prompt is counted on every query
+        prompt_tokens = count_message_tokens([SYSTEM_MESSAGE, {"role": "user", "content": file_prompt(query, "")}]) + cached.tokens
+        try:
+            model = router.route(prompt_tokens, ANSWER_TOKENS, model=self.model)
+        except ContextLengthExceeded:
+            return self.query_chunks(query, cached)
+
+        # Same questions on an unchanged file give the same prompt, so the answer is cached
+        answer = generate_text(prompt, model=model, messages=[SYSTEM_MESSAGE], cache=True)
+        return answer
+
+    def query_chunks(self, query, cached):
+        chunks = cached.memoize(("chunks", CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS), lambda content: split_tokens(content, CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS))
+        if len(chunks) > self.max_chunks:
+            return "ERROR: The string containing the file content is too large, try a different file or a different tool."
+
+        prompts = [
+            f"[QUERY]\n{query}\n[FILE_CONTENT] (part {i} of {len(chunks)})\n\'\'\'\n{chunk}\n'\'\'\n[ANSWER]"
+            for i, chunk in enumerate(chunks, start=1)
+        ]
+        model = router.route(max(count_tokens_many(prompts)) + count_message_tokens([MAP_SYSTEM_MESSAGE]), PARTIAL_ANSWER_TOKENS, model=self.model)
+        answers = generate_text_many(prompts, model=model, messages=[MAP_SYSTEM_MESSAGE], max_tokens=PARTIAL_ANSWER_TOKENS, max_concurrency=self.max_parallel_chunks, cache=True)
+
+        answers = [answer for answer in answers if answer and NO_INFORMATION not in answer]
+        if not answers:
+            return f"The file has no information relevant to the query. It was reviewed in {len(chunks)} parts."
+        return self.reduce_answers(query, answers)
+
+    def reduce_answers(self, query, answers):
+        # A model override with a small context gets smaller groups
+        max_group_tokens = REDUCE_INPUT_TOKENS
+        profile = router.get_profile(self.model) if self.model else None
+        if profile:
+            reserved_tokens = count_message_tokens([REDUCE_SYSTEM_MESSAGE, {"role": "user", "content": f"[QUERY]\n{query}\n[PARTIAL_ANSWERS]\n[ANSWER]"}]) + ANSWER_TOKENS
+            max_group_tokens = min(REDUCE_INPUT_TOKENS, int((profile.context_window - reserved_tokens) * 0.9))
+        while len(answers) > 1:
+            # Groups of partial answers that fit in one reduce prompt
+            groups = [[]]
+            group_tokens = 0
+            for answer, tokens in zip(answers, count_tokens_many(answers)):
+                if groups[-1] and group_tokens + tokens > max_group_tokens:
+                    groups.append([])
+                    group_tokens = 0
+                groups[-1].append(answer)
+                group_tokens += tokens
+            if len(groups) == len(answers):
+                raise ContextLengthExceeded(f"The partial answers do not fit in the context of {self.model} in pairs")
+
+            prompts = [
+                f"[QUERY]\n{query}\n[PARTIAL_ANSWERS]\n" + "\n\n".join(f"Part {i}:\n{answer}" for i, answer in enumerate(group, start=1)) + "\n[ANSWER]"
+                for group in groups
+            ]
+            model = router.route(max(count_tokens_many(prompts)) + count_message_tokens([REDUCE_SYSTEM_MESSAGE]), ANSWER_TOKENS, model=self.model)
+            answers = generate_text_many(prompts, model=model, messages=[REDUCE_SYSTEM_MESSAGE], max_tokens=ANSWER_TOKENS, max_concurrency=self.max_parallel_chunks, cache=True)
+        return answers[0]
+
+def file_prompt(query, file_content):
+    return f"[QUERY]\n{query}\n[FILE_CONTENT]\n\'\'\'\n{file_content}\n'\'\'\n[ANSWER]"
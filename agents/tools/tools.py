@@ -1,5 +1,5 @@
 from typing import Callable, List
-from utils import Logger
+from utils import Logger, span
 
 TYPE_MAP = {
     str: "string",
@@ -23,12 +23,13 @@ class Parameter:
         self.required = required
 
 class Tool:
-    def __init__(self, name: str, func: Callable, description: str, arguments: List[Parameter]):
+    def __init__(self, name: str, func: Callable, description: str, arguments: List[Parameter], timeout: float=None):
         self.name = name
         self.func = func
         self.description = description
         self.arguments = arguments
-        self.log = Logger()
+        self.timeout = timeout
+        self.log = Logger(name="tools")
 
     def validate_arguments(self, *args, **kwargs):
         for i, arg in enumerate(args):
@@ -46,15 +47,19 @@ class Tool:
                 raise ToolExecutionError(f"Argument {arg.name}: Expected {arg.type}, got {type(value)}")
 
     def execute(self, *args, **kwargs):
-        self.log.info(f"Executing {self.name} with args: {args} and kwargs: {kwargs}")
-        self.validate_arguments(*args, **kwargs)
-        try:
-            result = self.func(*args, **kwargs)
-            self.log.info(f"Result: {result}")
-        except Exception as e:
-            self.log.info(f"Error executing {self.name}: {e}")
-            raise ToolExecutionError(f"Error executing {self.name}: {e}")
-        return result
+        with span("tool.execute", tool=self.func.__name__) as tool_span:
+            self.log.info(f"Executing {self.name} with args: {args} and kwargs: {kwargs}")
+            self.validate_arguments(*args, **kwargs)
+            try:
+                result = self.func(*args, **kwargs)
+                self.log.debug(f"Result: {result}")
+                result_chars = len(str(result))
+                self.log.info(f"{self.name} returned {result_chars} characters")
+            except Exception as e:
+                self.log.info(f"Error executing {self.name}: {e}")
+                raise ToolExecutionError(f"Error executing {self.name}: {e}")
+            tool_span.set_attribute("result_chars", result_chars)
+            return result
     
     def get_schema(self) -> dict:
         schema = {
@@ -0,0 +1,191 @@
+# Offline benchmark of the agent loop. Drives Agent.execute_chain_of_thought against the
+# MockBackend, so the numbers are the agent's own overhead (prompt assembly, memory scoring,
+# logging, tool dispatch) plus the simulated latency, without network or API key.
+#
+#   python -m benchmarks.agent_benchmark --history 0,1000,10000 --tools 1,10,50 --iterations 1,5
+import argparse
+import contextlib
+import functools
+import io
+import json
+import os
+import time
+import tracemalloc
+from collections import defaultdict
+from itertools import product
+
+# Keep the benchmark away from the on-disk caches of real runs
+os.environ.setdefault("EMBEDDING_CACHE_PATH", "")
+os.environ.setdefault("LLM_CACHE_MODE", "off")
+
+from agents import Agent
+from agents.tools import Tool, Parameter
+from agents.memory import RelevantMemories
+from llm import MockBackend, set_backend
+from utils import Logger
+
+PHASES = ["memory", "think", "select_tool", "think_and_select_tool", "act", "final_answer"]
+
+WORDS = "agent memory tool file repository query answer model token prompt search result step goal".split()
+
+class TimedMockBackend(MockBackend):
+    def __init__(self, phases, **kwargs):
+        super().__init__(**kwargs)
+        self.phases = phases
+
+    async def chat_completion(self, **payload):
+        start = time.perf_counter()
+        try:
+            return await super().chat_completion(**payload)
+        finally:
+            self.phases["llm_backend"] += time.perf_counter() - start
+
+    async def stream_chat_completion(self, **payload):
+        start = time.perf_counter()
+        try:
+            async for chunk in super().stream_chat_completion(**payload):
+                yield chunk
+        finally:
+            self.phases["llm_backend"] += time.perf_counter() - start
+
+    async def embeddings(self, **payload):
+        start = time.perf_counter()
+        try:
+            return await super().embeddings(**payload)
+        finally:
+            self.phases["llm_backend"] += time.perf_counter() - start
+
+def timed(phases, phase, func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            phases[phase] += time.perf_counter() - start
+    return wrapper
+
+def make_sentence(i, length=20):
+    return " ".join(WORDS[(i * 7 + j * 3) % len(WORDS)] for j in range(length)) + f" ({i})"
+
+def make_tools(n_tools, observation_size):
+    tools = []
+    for i in range(n_tools):
+        def func(query: str, i=i):
+            return f"Result of tool {i} for '{query}': " + make_sentence(i, observation_size)
+        func.__name__ = f"tool_{i}"
+        tools.append(Tool(
+            name=f"Tool {i}",
+            func=func,
+            description=f"Benchmark tool number {i}. Returns a fixed observation for the query.",
+            arguments=[Parameter("query", "The query to run.", str, required=True)]
+        ))
+    return tools
+
+def make_history(history_size):
+    return [{"role": "user" if i % 2 == 0 else "assistant", "content": make_sentence(i)} for i in range(history_size)]
+
+def script(backend, n_tools, iterations, fused):
+    function_calls = []
+    for i in range(iterations):
+        arguments = {"query": f"query {i}"}
+        if fused:
+            arguments["thought"] = f"I should use tool_{i % n_tools}."
+        function_calls.append({"name": f"tool_{i % n_tools}", "arguments": arguments})
+    # In fused mode the thought comes with the function call, only the final answer is plain text
+    thoughts = [] if fused else [f"I should use tool_{i % n_tools}." for i in range(iterations)]
+    responses = thoughts + ["Final answer of the benchmark."]
+    backend.script(responses=responses, function_calls=function_calls)
+
+def run_case(history_size, n_tools, iterations, args):
+    phases = defaultdict(float)
+    # The agent prints its steps, which is not what is being measured
+    output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    backend = TimedMockBackend(phases, latency=args.latency, embedding_dim=args.embedding_dim)
+    set_backend(backend)
+
+    # Logging is timed for every Logger, it runs inside the other phases
+    write_log = Logger._write_log
+    Logger._write_log = timed(phases, "logging", write_log)
+    try:
+        memory = RelevantMemories()
+        memory.add_many_to_memory(make_history(history_size))
+        agent = Agent(make_tools(n_tools, args.observation_size), memory=memory, fused=args.fused)
+        for phase in PHASES[1:]:
+            setattr(agent, phase, timed(phases, phase, getattr(agent, phase)))
+        memory.add_to_memory = timed(phases, "memory", memory.add_to_memory)
+        memory.get_relevant_memories = timed(phases, "memory", memory.get_relevant_memories)
+
+        totals = []
+        phases.clear()
+        with output:
+            for repeat in range(args.repeats):
+                script(backend, n_tools, iterations, args.fused)
+                start = time.perf_counter()
+                agent.execute_chain_of_thought(f"Benchmark goal {repeat}", max_iterations=iterations)
+                totals.append(time.perf_counter() - start)
+            timings = {phase: value / args.repeats for phase, value in phases.items()}
+
+            # Separate run for memory, tracemalloc slows everything down
+            script(backend, n_tools, iterations, args.fused)
+            tracemalloc.start()
+            agent.execute_chain_of_thought("Benchmark goal (memory)", max_iterations=iterations)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+    finally:
+        Logger._write_log = write_log
+        backend.close()
+
+    total = sum(totals) / len(totals)
+    return {
+        "history": history_size,
+        "tools": n_tools,
+        "iterations": iterations,
+        "fused": args.fused,
+        "total": total,
+        "min_total": min(totals),
+        "agent_overhead": total - timings.get("llm_backend", 0.0),
+        "phases": timings,
+        "peak_memory": peak,
+        "prompt_tokens": sum(stats["prompt_tokens"] for stats in agent.iteration_stats)
+    }
+
+def print_result(result):
+    phases = result["phases"]
+    columns = [f"{phase}={phases[phase] * 1000:.1f}" for phase in PHASES + ["logging", "llm_backend"] if phase in phases]
+    print(
+        f"history={result['history']:<6} tools={result['tools']:<4} iterations={result['iterations']:<3} "
+        f"total={result['total'] * 1000:.1f}ms overhead={result['agent_overhead'] * 1000:.1f}ms "
+        f"peak_memory={result['peak_memory'] / 1024 / 1024:.1f}MB prompt_tokens={result['prompt_tokens']}\n"
+        f"    ms per run: {' '.join(columns)}"
+    )
+
+def int_list(value):
+    return [int(item) for item in value.split(",")]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the agent loop against the offline mock LLM backend.")
+    parser.add_argument("--history", type=int_list, default=[0, 1000, 10000], help="Comma separated history sizes (messages in memory).")
+    parser.add_argument("--tools", type=int_list, default=[1, 10, 50], help="Comma separated tool counts.")
+    parser.add_argument("--iterations", type=int_list, default=[1, 5], help="Comma separated max_iterations values.")
+    parser.add_argument("--repeats", type=int, default=3, help="Runs per case, timings are averaged.")
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated seconds per LLM request.")
+    parser.add_argument("--embedding-dim", type=int, default=256, help="Size of the fake embeddings.")
+    parser.add_argument("--observation-size", type=int, default=50, help="Words in every tool observation.")
+    parser.add_argument("--fused", action="store_true", help="Benchmark the fused think/select_tool mode.")
+    parser.add_argument("--verbose", action="store_true", help="Show the steps printed by the agent.")
+    parser.add_argument("--json", help="Also write the results to this JSON file.")
+    args = parser.parse_args()
+
+    results = []
+    for history_size, n_tools, iterations in product(args.history, args.tools, args.iterations):
+        result = run_case(history_size, n_tools, iterations, args)
+        print_result(result)
+        results.append(result)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -1 +1,3 @@
-from .openai import generate_text, generate_text_with_function_call, generate_embeddings, count_tokens, gpt35_model, gpt35_16k_model, gpt4_model
\ No newline at end of file
+from .openai import generate_text, generate_text_many, agenerate_text_many, generate_text_with_function_call, generate_embeddings, generate_embeddings_batch, agenerate_text, astream_text, agenerate_text_with_function_call, agenerate_embeddings, agenerate_embeddings_batch, client, get_backend, set_backend, count_tokens, count_tokens_many, count_message_tokens, estimate_token_bounds, exceeds_token_limit, truncate_tokens, split_tokens, gpt35_model, gpt35_16k_model, gpt4_model, router, embedding_cache, response_cache, ResponseCacheMiss, track_usage
+from .backends import LLMBackend, MockBackend
+from .router import ModelRouter, ModelProfile, ContextLengthExceeded
\ No newline at end of file
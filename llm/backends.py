@@ -0,0 +1,158 @@
+import asyncio
+import hashlib
+import json
+import queue
+import random
+import threading
+import time
+
+# Interface of the LLM backends used by llm.openai. A backend serves the chat completion,
+# streaming and embedding requests (as OpenAI-shaped dicts) and owns the event loop, running on
+# a background thread, that the sync functions use through run_sync and iter_sync.
+class LLMBackend:
+    name = "base"
+
+    def __init__(self):
+        self.loop = None
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def _ensure_loop(self):
+        with self.lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                self.thread = threading.Thread(target=self.loop.run_forever, name=f"{self.name}-backend", daemon=True)
+                self.thread.start()
+        return self.loop
+
+    async def _pump(self, async_iterable, put):
+        try:
+            async for item in async_iterable:
+                put((item, None))
+            put((STREAM_END, None))
+        except Exception as e:
+            put((STREAM_END, e))
+
+    # Iterates an async iterable on the backend loop from sync code
+    def iter_sync(self, async_iterable):
+        items = queue.Queue()
+        asyncio.run_coroutine_threadsafe(self._pump(async_iterable, items.put), self._ensure_loop())
+        while True:
+            item, error = items.get()
+            if error is not None:
+                raise error
+            if item is STREAM_END:
+                return
+            yield item
+
+    # Works from plain threads and from code that already runs inside an event loop (e.g. notebooks)
+    def run_sync(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self._ensure_loop()).result()
+
+    async def chat_completion(self, **payload):
+        raise NotImplementedError
+
+    async def stream_chat_completion(self, **payload):
+        raise NotImplementedError
+        yield
+
+    async def embeddings(self, **payload):
+        raise NotImplementedError
+
+    def close(self):
+        if self.loop is None:
+            return
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop = None
+
+# Deterministic local backend for offline runs and benchmarks, no API key needed.
+# - responses: scripted replies to plain chat completions, used in order
+# - function_calls: scripted replies to function calling requests, as {"name", "arguments"} dicts
+#   (arguments may be a dict or a JSON string). When the script runs out it calls final_answer
+# - latency: simulated seconds per request, or a function of the payload
+# - embedding_dim: size of the fake embeddings, unit vectors seeded by the text hash
+# Every payload is kept in `requests` for inspection.
+class MockBackend(LLMBackend):
+    name = "mock"
+
+    def __init__(self, responses=None, function_calls=None, latency=0.0, embedding_dim=256):
+        super().__init__()
+        self.responses = list(responses or [])
+        self.function_calls = list(function_calls or [])
+        self.latency = latency
+        self.embedding_dim = embedding_dim
+        self.requests = []
+        self.script_lock = threading.Lock()
+
+    def script(self, responses=None, function_calls=None):
+        with self.script_lock:
+            self.responses = list(responses or [])
+            self.function_calls = list(function_calls or [])
+
+    async def sleep(self, payload):
+        latency = self.latency(payload) if callable(self.latency) else self.latency
+        if latency:
+            await asyncio.sleep(latency)
+
+    def next_message(self, payload):
+        with self.script_lock:
+            self.requests.append(payload)
+            if payload.get("functions"):
+                function_call = self.function_calls.pop(0) if self.function_calls else {"name": "final_answer", "arguments": {}}
+                arguments = function_call.get("arguments", {})
+                if not isinstance(arguments, str):
+                    arguments = json.dumps(arguments)
+                return {"role": "assistant", "content": None, "function_call": {"name": function_call["name"], "arguments": arguments}}
+            content = self.responses.pop(0) if self.responses else f"Mock response {len(self.requests)}"
+            return {"role": "assistant", "content": content}
+
+    def usage(self, payload, completion):
+        prompt_tokens = sum(len(str(message.get("content") or "").split()) for message in payload.get("messages", []))
+        completion_tokens = len(completion.split())
+        return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+
+    async def chat_completion(self, **payload):
+        await self.sleep(payload)
+        message = self.next_message(payload)
+        completion = message["content"] or message["function_call"]["arguments"]
+        return {
+            "id": f"mock-{len(self.requests)}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model") or self.name,
+            "choices": [{"index": 0, "message": message, "finish_reason": "function_call" if message["content"] is None else "stop"}],
+            "usage": self.usage(payload, completion)
+        }
+
+    async def stream_chat_completion(self, **payload):
+        await self.sleep(payload)
+        message = self.next_message(payload)
+        content = message["content"] or ""
+        for i in range(0, len(content), STREAM_CHUNK_SIZE):
+            yield {"choices": [{"index": 0, "delta": {"content": content[i:i + STREAM_CHUNK_SIZE]}}]}
+            await asyncio.sleep(0)
+        yield {"choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+
+    async def embeddings(self, **payload):
+        await self.sleep(payload)
+        texts = payload["input"]
+        if isinstance(texts, str):
+            texts = [texts]
+        return {
+            "object": "list",
+            "model": payload.get("model") or self.name,
+            "data": [{"object": "embedding", "index": i, "embedding": self.fake_embedding(text)} for i, text in enumerate(texts)],
+            "usage": {"prompt_tokens": sum(len(text.split()) for text in texts), "total_tokens": sum(len(text.split()) for text in texts)}
+        }
+
+    def fake_embedding(self, text):
+        rng = random.Random(hashlib.sha256(text.encode("utf-8")).digest())
+        embedding = [rng.gauss(0.0, 1.0) for _ in range(self.embedding_dim)]
+        norm = sum(value * value for value in embedding) ** 0.5
+        return [value / norm for value in embedding]
+
+STREAM_END = object()
+
+# Characters per streamed delta of the mock backend
+STREAM_CHUNK_SIZE = 16
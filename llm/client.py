@@ -0,0 +1,111 @@
+import asyncio
+import json
+import os
+import aiohttp
+from .backends import LLMBackend, STREAM_END
+
+class OpenAIError(Exception):
+    def __init__(self, status, message):
+        super().__init__(f"OpenAI API error {status}: {message}")
+        self.status = status
+
+# Async HTTP client for the OpenAI API. All requests run on one event loop owned by a
+# background thread, so a single keep-alive connection pool is shared by sync callers
+# (through run_sync) and by coroutines running on any other event loop.
+class AsyncOpenAIClient(LLMBackend):
+    name = "openai"
+
+    def __init__(self, api_key=None, api_base=None, max_connections=16, max_concurrency=8, timeout=600):
+        super().__init__()
+        self.api_key = api_key
+        self.api_base = (api_base or os.getenv("OPENAI_API_BASE") or "https://api.openai.com/v1").rstrip("/")
+        self.max_connections = max_connections
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.session = None
+        self.semaphore = None
+
+    def _get_session(self):
+        if self.session is None or self.session.closed:
+            api_key = self.api_key or os.getenv("OPENAI_API_KEY")
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_connections, keepalive_timeout=60),
+                headers={"Authorization": f"Bearer {api_key}"},
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+            self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self.session
+
+    async def _post(self, path, payload):
+        session = self._get_session()
+        async with self.semaphore:
+            async with session.post(f"{self.api_base}{path}", json=payload) as response:
+                data = await response.json(content_type=None)
+                if response.status >= 400:
+                    raise OpenAIError(response.status, data.get("error", {}).get("message", data) if isinstance(data, dict) else data)
+                return data
+
+    async def _stream(self, path, payload):
+        session = self._get_session()
+        async with self.semaphore:
+            async with session.post(f"{self.api_base}{path}", json=payload) as response:
+                if response.status >= 400:
+                    data = await response.json(content_type=None)
+                    raise OpenAIError(response.status, data.get("error", {}).get("message", data) if isinstance(data, dict) else data)
+                # Server-sent events, one "data: {...}" line per chunk
+                async for line in response.content:
+                    line = line.strip()
+                    if not line.startswith(b"data:"):
+                        continue
+                    data = line[len(b"data:"):].strip()
+                    if data == b"[DONE]":
+                        break
+                    yield json.loads(data)
+
+    async def stream(self, path, payload):
+        loop = self._ensure_loop()
+        if asyncio.get_running_loop() is loop:
+            async for chunk in self._stream(path, payload):
+                yield chunk
+            return
+
+        caller_loop = asyncio.get_running_loop()
+        chunks = asyncio.Queue()
+        def put(item):
+            caller_loop.call_soon_threadsafe(chunks.put_nowait, item)
+        asyncio.run_coroutine_threadsafe(self._pump(self._stream(path, payload), put), loop)
+        while True:
+            chunk, error = await chunks.get()
+            if error is not None:
+                raise error
+            if chunk is STREAM_END:
+                return
+            yield chunk
+
+    async def post(self, path, payload):
+        loop = self._ensure_loop()
+        if asyncio.get_running_loop() is loop:
+            return await self._post(path, payload)
+        future = asyncio.run_coroutine_threadsafe(self._post(path, payload), loop)
+        return await asyncio.wrap_future(future)
+
+    async def chat_completion(self, **payload):
+        return await self.post("/chat/completions", drop_none(payload))
+
+    async def stream_chat_completion(self, **payload):
+        async for chunk in self.stream("/chat/completions", drop_none({**payload, "stream": True})):
+            yield chunk
+
+    async def embeddings(self, **payload):
+        return await self.post("/embeddings", drop_none(payload))
+
+    def close(self):
+        if self.loop is None:
+            return
+        if self.session is not None:
+            asyncio.run_coroutine_threadsafe(self.session.close(), self.loop).result()
+        super().close()
+        self.session = None
+
+def drop_none(payload):
+    return {key: value for key, value in payload.items() if value is not None}
@@ -0,0 +1,78 @@
+import hashlib
+from array import array
+from utils.sqlite_cache import SQLiteCache
+
+# Texts looked up in one SQLite query, below the default limit of 999 parameters of older SQLite
+SQLITE_BATCH_SIZE = 500
+
+# Embeddings keyed by (model, sha256 of text), in an in-memory LRU and in SQLite so the cache
+# survives restarts
+class EmbeddingCache(SQLiteCache):
+    def __init__(self, path=None, max_items=10000):
+        super().__init__(path, "embeddings", "model TEXT, hash TEXT, embedding BLOB, PRIMARY KEY (model, hash)", max_items)
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def get(self, model, text):
+        return self.get_many(model, [text])[0]
+
+    # Embeddings of the texts, None for the ones not in the cache. The texts missing from the
+    # in-memory LRU are looked up in SQLite with one query per SQLITE_BATCH_SIZE texts.
+    def get_many(self, model, texts):
+        keys = [cache_key(model, text) for text in texts]
+        embeddings = [None] * len(keys)
+        with self.lock:
+            missing = {}
+            for i, key in enumerate(keys):
+                embeddings[i] = self.recall(key)
+                if embeddings[i] is not None:
+                    self.hits += 1
+                else:
+                    missing.setdefault(key, []).append(i)
+
+            db = self.connect()
+            if missing and db is not None:
+                hashes = [text_hash for _, text_hash in missing]
+                for start in range(0, len(hashes), SQLITE_BATCH_SIZE):
+                    batch = hashes[start:start + SQLITE_BATCH_SIZE]
+                    rows = db.execute(f"SELECT hash, embedding FROM embeddings WHERE model = ? AND hash IN ({', '.join('?' * len(batch))})", (keys[0][0], *batch))
+                    for text_hash, blob in rows:
+                        key = (keys[0][0], text_hash)
+                        embedding = array("f", blob).tolist()
+                        self.remember(key, embedding)
+                        for i in missing.pop(key):
+                            embeddings[i] = embedding
+                            self.disk_hits += 1
+
+            self.misses += sum(len(positions) for positions in missing.values())
+        return embeddings
+
+    def put(self, model, text, embedding):
+        self.put_many(model, [text], [embedding])
+
+    # Stores the embeddings of the texts in one SQLite transaction
+    def put_many(self, model, texts, embeddings):
+        rows = []
+        with self.lock:
+            for text, embedding in zip(texts, embeddings):
+                key = cache_key(model, text)
+                self.remember(key, embedding)
+                rows.append((*key, array("f", embedding).tobytes()))
+            db = self.connect()
+            if db is not None and rows:
+                with db:
+                    db.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)", rows)
+
+    def stats(self):
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            "memory_items": len(self.items)
+        }
+
+def cache_key(model, text):
+    return (model or "", hashlib.sha256(text.encode("utf-8")).hexdigest())
@@ -1,18 +1,41 @@
-import openai
+import asyncio
+import atexit
+import contextvars
 import os
+import time
 import tiktoken
-from tenacity import retry, wait_random_exponential, stop_after_attempt
+from contextlib import contextmanager
+from functools import lru_cache
+from tenacity import retry, retry_if_not_exception_type, wait_random_exponential, stop_after_attempt
 from dotenv import load_dotenv
-from utils import Logger
+from utils import Logger, span
+from utils.tracing import record_retry
+from .backends import MockBackend
+from .client import AsyncOpenAIClient
+from .embedding_cache import EmbeddingCache
+from .response_cache import ResponseCache, ResponseCacheMiss, request_key
+from .router import ModelRouter, ModelProfile
 
-# Logger
-logger = Logger()
+# Logger, full prompts and responses are only logged with LOG_LEVEL=DEBUG
+logger = Logger(name="llm")
 
 # Load secrets and config from .env file
 load_dotenv()
 
-# OpenAI API
-openai.api_key = os.getenv("OPENAI_API_KEY")
+# OpenAI API, a shared keep-alive connection pool used by the sync and async functions
+client = AsyncOpenAIClient(
+    max_connections=int(os.getenv("OPENAI_MAX_CONNECTIONS", "16")),
+    max_concurrency=int(os.getenv("OPENAI_MAX_CONCURRENCY", "8"))
+)
+atexit.register(client.close)
+
+# Backend serving the requests, LLM_BACKEND=mock runs everything offline against MockBackend
+if os.getenv("LLM_BACKEND", "openai") == "mock":
+    backend = MockBackend(latency=float(os.getenv("LLM_MOCK_LATENCY", "0")))
+    atexit.register(backend.close)
+else:
+    backend = client
+
 embedding_model = os.getenv("OPENAI_EMBEDDING_MODEL")
 
 # Model endpoint names
@@ -20,87 +43,357 @@ gpt35_model = os.getenv("OPENAI_GPT35_MODEL")
 gpt35_16k_model = os.getenv("OPENAI_GPT35_16K_MODEL")
 gpt4_model = os.getenv("OPENAI_GPT4_MODEL")
 
-@retry(wait=wait_random_exponential(min=1, max=20), stop=stop_after_attempt(3))
-def generate_text(prompt, model=gpt35_model, messages=[], max_tokens=-1, temperature=1.0, top_p=1.0, frequency_penalty=0.0, presence_penalty=0.0, stop=None):
+# Model router, context window and USD per 1K prompt/completion tokens of every model
+router = ModelRouter([
+    ModelProfile(gpt35_model, 4096, 0.0015, 0.002),
+    ModelProfile(gpt35_16k_model, 16384, 0.003, 0.004),
+    ModelProfile(gpt4_model, 8192, 0.03, 0.06)
+])
+
+# Embedding cache, an empty EMBEDDING_CACHE_PATH keeps it in memory only
+embedding_cache = EmbeddingCache(os.getenv("EMBEDDING_CACHE_PATH", "./cache/embeddings.db"))
+
+# Chat completion response cache, see ResponseCache for the modes
+response_cache = ResponseCache(
+    path=os.getenv("LLM_CACHE_PATH", "./cache/responses.db"),
+    mode=os.getenv("LLM_CACHE_MODE", "auto"),
+    ttl=float(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600))),
+    max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "10000"))
+)
+
+# Tokenizer used to count tokens
+tokenizer_model = "gpt-3.5-turbo"
+
+# Batched embedding requests
+EMBEDDING_BATCH_SIZE = 100
+
+# Formatting tokens added to every chat message, and to prime the reply
+MESSAGE_TOKEN_OVERHEAD = 4
+REPLY_TOKEN_OVERHEAD = 3
+
+def get_backend():
+    return backend
+
+# Routes every request (including the sync wrappers) to another LLMBackend, e.g. a MockBackend
+def set_backend(new_backend):
+    global backend
+    backend = new_backend
+
+# Keeps the cached responses and embeddings of other backends apart from the OpenAI ones
+def cache_model(model):
+    return model if backend is client else f"{backend.name}:{model}"
+
+# Token usage of the chat completions made inside track_usage(): as reported by the API, counted
+# locally for streamed responses (they carry no usage)
+usage_collector = contextvars.ContextVar("usage_collector", default=None)
+
+@contextmanager
+def track_usage():
+    usage = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0}
+    token = usage_collector.set(usage)
+    try:
+        yield usage
+    finally:
+        try:
+            usage_collector.reset(token)
+        except ValueError:
+            # Exited from another context, e.g. a generator finalized elsewhere
+            pass
+
+def record_usage(prompt_tokens, completion_tokens):
+    usage = usage_collector.get()
+    if usage is not None:
+        usage["calls"] += 1
+        usage["prompt_tokens"] += prompt_tokens
+        usage["completion_tokens"] += completion_tokens
+
+def log_request(model, messages, **fields):
+    logger.info("Chat completion request", model=model, messages=len(messages), prompt_chars=sum(len(message.get("content") or "") for message in messages), **fields)
+
+# One span per call, opened outside the retried request so it carries the retry count of the call
+async def create_chat_completion(payload, cache=False):
+    with span("llm.chat_completion", model=payload["model"], backend=backend.name) as llm_span:
+        return await request_chat_completion(payload, cache, llm_span)
+
+@retry(wait=wait_random_exponential(min=1, max=20), stop=stop_after_attempt(3), retry=retry_if_not_exception_type(ResponseCacheMiss), before_sleep=record_retry)
+async def request_chat_completion(payload, cache, llm_span):
+    key = request_key({**payload, "model": cache_model(payload["model"])})
+    if response_cache.should_read(payload, cache):
+        response = response_cache.get(key)
+        if response is not None:
+            logger.info("Response served from cache", key=key)
+            llm_span.set_attribute("cached", True)
+            return response
+    start = time.perf_counter()
+    response = await backend.chat_completion(**payload)
+    usage = response.get("usage") or {}
+    router.record(payload["model"], usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0), time.perf_counter() - start)
+    record_usage(usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0))
+    llm_span.set_attributes(prompt_tokens=usage.get("prompt_tokens", 0), completion_tokens=usage.get("completion_tokens", 0))
+    if response_cache.should_write(payload, cache):
+        response_cache.put(key, response)
+    return response
+
+# cache=True stores and reuses the response even when temperature is not 0
+async def agenerate_text(prompt, model=gpt35_model, messages=[], max_tokens=-1, temperature=1.0, top_p=1.0, frequency_penalty=0.0, presence_penalty=0.0, stop=None, cache=False):
     _messages = []
     for msg in messages:
         _messages.append({"role": msg.get("role",""), "content": msg.get("content","")})
     _messages.append({"role": "user", "content": prompt})
     
-    _log_message = "\n\n============================ PROMPT ============================\n"
-    for message in _messages:
-        _log_message += f"{message['role']}: {message['content']}\n"
-    logger.info(_log_message)
+    if logger.enabled("DEBUG"):
+        _log_message = "\n\n============================ PROMPT ============================\n"
+        for message in _messages:
+            _log_message += f"{message['role']}: {message['content']}\n"
+        logger.debug(_log_message)
+    log_request(model, _messages, stream=False)
     
     if max_tokens == -1:
         max_tokens = None
         
-    response = openai.ChatCompletion.create(
-        model=model,
-        messages=_messages,
-        max_tokens=max_tokens,
-        temperature=temperature,
-        top_p=top_p,
-        frequency_penalty=frequency_penalty,
-        presence_penalty=presence_penalty,
-        stop=stop
-    )
-    _log_message = "\n\n============================ RESPONSE ============================\n"
-    _log_message += f"{response}\n"
-    logger.info(_log_message)
+    response = await create_chat_completion({
+        "model": model,
+        "messages": _messages,
+        "max_tokens": max_tokens,
+        "temperature": temperature,
+        "top_p": top_p,
+        "frequency_penalty": frequency_penalty,
+        "presence_penalty": presence_penalty,
+        "stop": stop
+    }, cache)
+    if logger.enabled("DEBUG"):
+        _log_message = "\n\n============================ RESPONSE ============================\n"
+        _log_message += f"{response}\n"
+        logger.debug(_log_message)
+    logger.info("Chat completion response", model=model, usage=response.get("usage"))
     
     return response["choices"][0]["message"]["content"]
 
-@retry(wait=wait_random_exponential(min=1, max=20), stop=stop_after_attempt(3))
-def generate_text_with_function_call(prompt, model=gpt35_model, messages=[], functions=[], max_tokens=-1, temperature=1.0, top_p=1.0, frequency_penalty=0.0, presence_penalty=0.0, stop=None, function_call='auto'):
+async def astream_text(prompt, model=gpt35_model, messages=[], max_tokens=-1, temperature=1.0, top_p=1.0, frequency_penalty=0.0, presence_penalty=0.0, stop=None, cache=False):
+    _messages = []
+    for msg in messages:
+        _messages.append({"role": msg.get("role",""), "content": msg.get("content","")})
+    _messages.append({"role": "user", "content": prompt})
+
+    if logger.enabled("DEBUG"):
+        _log_message = "\n\n============================ PROMPT (STREAM) ============================\n"
+        for message in _messages:
+            _log_message += f"{message['role']}: {message['content']}\n"
+        logger.debug(_log_message)
+    log_request(model, _messages, stream=True)
+
+    if max_tokens == -1:
+        max_tokens = None
+
+    payload = {
+        "model": model,
+        "messages": _messages,
+        "max_tokens": max_tokens,
+        "temperature": temperature,
+        "top_p": top_p,
+        "frequency_penalty": frequency_penalty,
+        "presence_penalty": presence_penalty,
+        "stop": stop
+    }
+    with span("llm.stream_chat_completion", model=model, backend=backend.name) as llm_span:
+        key = request_key({**payload, "model": cache_model(payload["model"])})
+        if response_cache.should_read(payload, cache):
+            cached_response = response_cache.get(key)
+            if cached_response is not None:
+                logger.info("Response served from cache", key=key)
+                llm_span.set_attribute("cached", True)
+                yield cached_response["choices"][0]["message"]["content"]
+                return
+
+        response = ""
+        start = time.perf_counter()
+        async for chunk in backend.stream_chat_completion(**payload):
+            if not chunk.get("choices"):
+                continue
+            delta = chunk["choices"][0].get("delta", {}).get("content")
+            if delta:
+                response += delta
+                yield delta
+
+        # Streamed responses carry no usage, the tokens are counted here
+        latency = time.perf_counter() - start
+        prompt_tokens, completion_tokens = count_message_tokens(_messages), count_tokens(response)
+        router.record(model, prompt_tokens, completion_tokens, latency)
+        record_usage(prompt_tokens, completion_tokens)
+        llm_span.set_attributes(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+        if response_cache.should_write(payload, cache):
+            response_cache.put(key, {"choices": [{"message": {"role": "assistant", "content": response}}]})
+
+    if logger.enabled("DEBUG"):
+        _log_message = "\n\n============================ RESPONSE (STREAM) ============================\n"
+        _log_message += f"{response}\n"
+        logger.debug(_log_message)
+    logger.info("Chat completion response", model=model, stream=True, completion_chars=len(response))
+
+# With stream=True returns an iterator over the text deltas as they arrive
+def generate_text(prompt, model=gpt35_model, messages=[], max_tokens=-1, temperature=1.0, top_p=1.0, frequency_penalty=0.0, presence_penalty=0.0, stop=None, stream=False, cache=False):
+    if stream:
+        return backend.iter_sync(astream_text(prompt, model, messages, max_tokens, temperature, top_p, frequency_penalty, presence_penalty, stop, cache))
+    return backend.run_sync(agenerate_text(prompt, model, messages, max_tokens, temperature, top_p, frequency_penalty, presence_penalty, stop, cache))
+
+# Runs the prompts concurrently, at most max_concurrency at a time, and returns the answers in order
+async def agenerate_text_many(prompts, model=gpt35_model, messages=[], max_tokens=-1, temperature=1.0, max_concurrency=4, cache=False):
+    semaphore = asyncio.Semaphore(max_concurrency)
+    async def generate(prompt):
+        async with semaphore:
+            return await agenerate_text(prompt, model=model, messages=messages, max_tokens=max_tokens, temperature=temperature, cache=cache)
+    return await asyncio.gather(*[generate(prompt) for prompt in prompts])
+
+def generate_text_many(prompts, model=gpt35_model, messages=[], max_tokens=-1, temperature=1.0, max_concurrency=4, cache=False):
+    return backend.run_sync(agenerate_text_many(prompts, model, messages, max_tokens, temperature, max_concurrency, cache))
+
+async def agenerate_text_with_function_call(prompt, model=gpt35_model, messages=[], functions=[], max_tokens=-1, temperature=1.0, top_p=1.0, frequency_penalty=0.0, presence_penalty=0.0, stop=None, function_call='auto', cache=False):
     _messages = []
     _messages.extend(messages)
     _messages.append({"role": "user", "content": prompt})
 
-    _log_message = "\n\n============================ FUNCTION CALL ============================\n"
-    _log_message += "Functions:\n"
-    for function in functions:
-        _log_message += f"{function}\n"
-    
-    _log_message += "Messages:\n"
-    for message in _messages:
-        _log_message += f"{message['role']}: {message['content']}\n"
-        
-    logger.info(_log_message)
+    if logger.enabled("DEBUG"):
+        _log_message = "\n\n============================ FUNCTION CALL ============================\n"
+        _log_message += "Functions:\n"
+        for function in functions:
+            _log_message += f"{function}\n"
+
+        _log_message += "Messages:\n"
+        for message in _messages:
+            _log_message += f"{message['role']}: {message['content']}\n"
+        logger.debug(_log_message)
+    log_request(model, _messages, functions=len(functions))
     
     if max_tokens == -1:
         max_tokens = None
 
-    response = openai.ChatCompletion.create(
-        model=model,
-        messages=_messages,
-        functions=functions,
-        max_tokens=max_tokens,
-        temperature=temperature,
-        top_p=top_p,
-        frequency_penalty=frequency_penalty,
-        presence_penalty=presence_penalty,
-        stop=stop,
-        function_call=function_call
-    )
-    _log_message = "\n\n============================ RESPONSE ============================\n"
-    _log_message += f"{response}\n"
-    logger.info(_log_message)
+    response = await create_chat_completion({
+        "model": model,
+        "messages": _messages,
+        "functions": functions,
+        "max_tokens": max_tokens,
+        "temperature": temperature,
+        "top_p": top_p,
+        "frequency_penalty": frequency_penalty,
+        "presence_penalty": presence_penalty,
+        "stop": stop,
+        "function_call": function_call
+    }, cache)
+    if logger.enabled("DEBUG"):
+        _log_message = "\n\n============================ RESPONSE ============================\n"
+        _log_message += f"{response}\n"
+        logger.debug(_log_message)
+    logger.info("Chat completion response", model=model, usage=response.get("usage"))
     
     if "function_call" in response["choices"][0]["message"]:
         return response["choices"][0]["message"]["function_call"]
     else:
         return None
-    
 
-@retry(wait=wait_random_exponential(min=1, max=20), stop=stop_after_attempt(3))
+def generate_text_with_function_call(prompt, model=gpt35_model, messages=[], functions=[], max_tokens=-1, temperature=1.0, top_p=1.0, frequency_penalty=0.0, presence_penalty=0.0, stop=None, function_call='auto', cache=False):
+    return backend.run_sync(agenerate_text_with_function_call(prompt, model, messages, functions, max_tokens, temperature, top_p, frequency_penalty, presence_penalty, stop, function_call, cache))
+
+# The embedding cache reads and writes SQLite, it runs in the default executor so the requests
+# in flight on the backend loop are not blocked by it
+async def run_blocking(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+async def agenerate_embeddings(text):
+    model = cache_model(embedding_model)
+    embedding = await run_blocking(embedding_cache.get, model, text)
+    if embedding is None:
+        embedding = (await arequest_embeddings([text]))[0]
+        await run_blocking(embedding_cache.put, model, text, embedding)
+    return embedding
+
 def generate_embeddings(text):
-    response = openai.Embedding.create(input=text, engine=embedding_model)
-    embeddings = response["data"][0]['embedding']
+    return backend.run_sync(agenerate_embeddings(text))
+
+async def agenerate_embeddings_batch(texts, batch_size=EMBEDDING_BATCH_SIZE):
+    model = cache_model(embedding_model)
+    embeddings = await run_blocking(embedding_cache.get_many, model, texts)
+
+    # Only request each missing text once
+    missing_texts = list(dict.fromkeys(text for text, embedding in zip(texts, embeddings) if embedding is None))
+    if missing_texts:
+        batches = [missing_texts[i:i + batch_size] for i in range(0, len(missing_texts), batch_size)]
+        logger.info(f"Requesting embeddings for {len(missing_texts)} texts in {len(batches)} batches. {len(texts) - len(missing_texts)} texts found in cache.")
+        # Batches run concurrently, bounded by the backend's max_concurrency
+        batch_results = await asyncio.gather(*[arequest_embeddings(batch) for batch in batches])
+
+        new_embeddings = [embedding for batch_embeddings in batch_results for embedding in batch_embeddings]
+        await run_blocking(embedding_cache.put_many, model, missing_texts, new_embeddings)
+        new_embeddings = dict(zip(missing_texts, new_embeddings))
+        embeddings = [new_embeddings[text] if embedding is None else embedding for text, embedding in zip(texts, embeddings)]
+
     return embeddings
 
-def count_tokens(input_txt=""):
+def generate_embeddings_batch(texts, batch_size=EMBEDDING_BATCH_SIZE):
+    return backend.run_sync(agenerate_embeddings_batch(texts, batch_size))
+
+async def arequest_embeddings(texts):
+    if response_cache.mode == "replay":
+        raise ResponseCacheMiss(f"No recorded embeddings for {len(texts)} texts")
+    with span("llm.embeddings", model=embedding_model, backend=backend.name, texts=len(texts)) as llm_span:
+        response = await request_embeddings(texts)
+        llm_span.set_attribute("prompt_tokens", (response.get("usage") or {}).get("prompt_tokens", 0))
+    data = sorted(response["data"], key=lambda item: item["index"])
+    return [item["embedding"] for item in data]
+
+@retry(wait=wait_random_exponential(min=1, max=20), stop=stop_after_attempt(3), retry=retry_if_not_exception_type(ResponseCacheMiss), before_sleep=record_retry)
+async def request_embeddings(texts):
+    return await backend.embeddings(input=texts, model=embedding_model)
+
+@lru_cache(maxsize=None)
+def get_encoding(model=tokenizer_model):
+    return tiktoken.encoding_for_model(model)
+
+@lru_cache(maxsize=None)
+def max_token_bytes(model=tokenizer_model):
+    return max(len(token) for token in get_encoding(model).token_byte_values())
+
+def count_tokens(input_txt="", model=tokenizer_model):
     if not input_txt:
         return 0
-    enc = tiktoken.encoding_for_model("gpt-3.5-turbo")
-    return len(enc.encode(input_txt, disallowed_special=()))
\ No newline at end of file
+    return len(get_encoding(model).encode(input_txt, disallowed_special=()))
+
+def count_tokens_many(texts, model=tokenizer_model, num_threads=8):
+    encoded = get_encoding(model).encode_batch(list(texts), num_threads=num_threads, disallowed_special=())
+    return [len(tokens) for tokens in encoded]
+
+# Tokens of a chat prompt, including the formatting tokens of the messages
+def count_message_tokens(messages, model=tokenizer_model):
+    contents = [message.get("content") or "" for message in messages]
+    return sum(count_tokens_many(contents, model)) + MESSAGE_TOKEN_OVERHEAD * len(messages) + REPLY_TOKEN_OVERHEAD
+
+def truncate_tokens(input_txt, max_tokens, model=tokenizer_model):
+    tokens = get_encoding(model).encode(input_txt, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return input_txt
+    return get_encoding(model).decode(tokens[:max_tokens])
+
+# Splits the text along token boundaries in chunks of at most chunk_tokens tokens,
+# consecutive chunks share overlap_tokens tokens
+def split_tokens(input_txt, chunk_tokens, overlap_tokens=0, model=tokenizer_model):
+    if not 0 <= overlap_tokens < chunk_tokens:
+        raise ValueError(f"overlap_tokens must be between 0 and chunk_tokens ({chunk_tokens}), got {overlap_tokens}")
+    encoding = get_encoding(model)
+    tokens = encoding.encode(input_txt, disallowed_special=())
+    step = chunk_tokens - overlap_tokens
+    return [encoding.decode(tokens[start:start + chunk_tokens]) for start in range(0, max(len(tokens) - overlap_tokens, 1), step)]
+
+# Every token covers at least one byte and at most max_token_bytes bytes of UTF-8,
+# which bounds the token count without encoding the text
+def estimate_token_bounds(input_txt="", model=tokenizer_model):
+    if not input_txt:
+        return 0, 0
+    n_bytes = len(input_txt.encode("utf-8"))
+    return -(-n_bytes // max_token_bytes(model)), n_bytes
+
+def exceeds_token_limit(input_txt, max_tokens, model=tokenizer_model):
+    lower_bound, upper_bound = estimate_token_bounds(input_txt, model)
+    if upper_bound <= max_tokens:
+        return False
+    if lower_bound > max_tokens:
+        return True
+    return count_tokens(input_txt, model) > max_tokens
\ No newline at end of file
@@ -0,0 +1,83 @@
+import hashlib
+import json
+import time
+from utils.sqlite_cache import SQLiteCache
+
+MODES = ("off", "auto", "record", "replay")
+
+class ResponseCacheMiss(Exception):
+    pass
+
+# Disk cache of chat completion responses keyed by the full request (model, messages, functions
+# and sampling parameters). Modes:
+# - off: never cache
+# - auto: cache deterministic calls (temperature 0) and calls that opt in with cache=True
+# - record: always call the API and store every response
+# - replay: serve every call from the cache and raise ResponseCacheMiss when it is not there,
+#   so the agent loop can run offline against a recorded session
+class ResponseCache(SQLiteCache):
+    def __init__(self, path="./cache/responses.db", mode="auto", ttl=7 * 24 * 3600, max_entries=10000):
+        if mode not in MODES:
+            raise ValueError(f"Invalid response cache mode '{mode}'. Valid modes are {MODES}")
+        # Responses are only kept in SQLite, entries are evicted by TTL and by accessed_at
+        super().__init__(path or ":memory:", "responses", "key TEXT PRIMARY KEY, response TEXT, created_at REAL, accessed_at REAL")
+        self.mode = mode
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+    def should_read(self, payload, cache=False):
+        if self.mode == "replay":
+            return True
+        return self.mode == "auto" and (cache or payload.get("temperature") == 0)
+
+    def should_write(self, payload, cache=False):
+        if self.mode == "record":
+            return True
+        return self.mode == "auto" and (cache or payload.get("temperature") == 0)
+
+    def get(self, key):
+        with self.lock:
+            self.connect()
+            row = self.db.execute("SELECT response, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            # Recorded sessions never expire while replaying
+            if row and (self.mode == "replay" or time.time() - row[1] <= self.ttl):
+                self.db.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (time.time(), key))
+                self.db.commit()
+                self.hits += 1
+                return json.loads(row[0])
+            self.misses += 1
+        if self.mode == "replay":
+            raise ResponseCacheMiss(f"No recorded response for request {key}")
+        return None
+
+    def put(self, key, response):
+        now = time.time()
+        with self.lock:
+            self.connect()
+            self.db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)", (key, json.dumps(response), now, now))
+            self.evict(now)
+            self.db.commit()
+
+    def evict(self, now):
+        if self.mode != "record":
+            self.db.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,))
+        count = self.db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        if count > self.max_entries:
+            self.db.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY accessed_at LIMIT ?)",
+                (count - self.max_entries,)
+            )
+
+    def clear(self):
+        if self.mode != "off":
+            super().clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"mode": self.mode, "hits": self.hits, "misses": self.misses, "hit_rate": self.hits / lookups if lookups else 0.0}
+
+def request_key(payload):
+    payload = {key: value for key, value in payload.items() if key != "stream"}
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
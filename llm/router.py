@@ -0,0 +1,72 @@
+import threading
+from collections import defaultdict
+
+class ContextLengthExceeded(Exception):
+    pass
+
+# A routable model: its context window in tokens and its price in USD per 1K prompt/completion tokens
+class ModelProfile:
+    def __init__(self, name, context_window, prompt_cost, completion_cost):
+        self.name = name
+        self.context_window = context_window
+        self.prompt_cost = prompt_cost
+        self.completion_cost = completion_cost
+
+    def cost(self, prompt_tokens, completion_tokens):
+        return (prompt_tokens * self.prompt_cost + completion_tokens * self.completion_cost) / 1000
+
+# Picks the cheapest model whose context window fits the prompt plus the expected output, so small
+# prompts stop going to large-context models. A `model` passed to route() overrides the choice, it
+# still raises ContextLengthExceeded when the prompt does not fit in the context of a known model.
+# Latency, tokens and cost of every completed call are tracked per model.
+class ModelRouter:
+    def __init__(self, profiles, default_output_tokens=500):
+        self.profiles = sorted(profiles, key=lambda profile: (profile.cost(1000, 1000), profile.context_window))
+        self.default_output_tokens = default_output_tokens
+        self.lock = threading.Lock()
+        self.model_stats = defaultdict(lambda: {"routed": 0, "calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "latency": 0.0, "cost": 0.0})
+
+    def get_profile(self, model):
+        for profile in self.profiles:
+            if profile.name == model:
+                return profile
+        return None
+
+    def max_prompt_tokens(self, output_tokens=None):
+        output_tokens = self.default_output_tokens if output_tokens is None else output_tokens
+        return max(profile.context_window for profile in self.profiles) - output_tokens
+
+    def route(self, prompt_tokens, output_tokens=None, model=None):
+        output_tokens = self.default_output_tokens if output_tokens is None else output_tokens
+        if model is None:
+            for profile in self.profiles:
+                if prompt_tokens + output_tokens <= profile.context_window:
+                    model = profile.name
+                    break
+            else:
+                raise ContextLengthExceeded(f"{prompt_tokens} prompt tokens plus {output_tokens} output tokens do not fit in any model (max context {self.max_prompt_tokens(0)} tokens)")
+        else:
+            profile = self.get_profile(model)
+            if profile and prompt_tokens + output_tokens > profile.context_window:
+                raise ContextLengthExceeded(f"{prompt_tokens} prompt tokens plus {output_tokens} output tokens do not fit in {model} (context {profile.context_window} tokens)")
+        with self.lock:
+            self.model_stats[model]["routed"] += 1
+        return model
+
+    def record(self, model, prompt_tokens, completion_tokens, latency):
+        profile = self.get_profile(model)
+        with self.lock:
+            stats = self.model_stats[model]
+            stats["calls"] += 1
+            stats["prompt_tokens"] += prompt_tokens
+            stats["completion_tokens"] += completion_tokens
+            stats["latency"] += latency
+            if profile:
+                stats["cost"] += profile.cost(prompt_tokens, completion_tokens)
+
+    def stats(self):
+        with self.lock:
+            return {
+                model: {**stats, "mean_latency": stats["latency"] / stats["calls"] if stats["calls"] else 0.0}
+                for model, stats in self.model_stats.items()
+            }
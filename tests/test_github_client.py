@@ -0,0 +1,148 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from agents.tools.github import client as client_module
+from agents.tools.github.client import GitHubCache, GitHubClient
+
+# Local stand-in for the GitHub API. Every test sets `responses`, a list of (status, headers, body)
+# answered in order (the last one is repeated), and reads the request headers from `requests`.
+class StubGitHub(BaseHTTPRequestHandler):
+    responses = []
+    requests = []
+
+    def do_GET(self):
+        StubGitHub.requests.append({"path": self.path, **dict(self.headers)})
+        status, headers, body = StubGitHub.responses[min(len(StubGitHub.requests), len(StubGitHub.responses)) - 1]
+        data = json.dumps(body).encode("utf-8") if body is not None else b""
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def server():
+    StubGitHub.responses = []
+    StubGitHub.requests = []
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), StubGitHub)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+# Clock of the client module, sleeping records the wait and moves the clock forward
+class FakeClock:
+    def __init__(self):
+        self.now = time.time()
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(client_module, "time", clock)
+    return clock.sleeps
+
+def make_client(server, tmp_path, token="token"):
+    return GitHubClient(token=token, base_url=server, cache=GitHubCache(str(tmp_path / "github.db")))
+
+def test_not_modified_is_answered_from_the_cache(server, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    StubGitHub.responses = [
+        (200, {"ETag": '"v1"'}, {"login": "octocat"}),
+        (304, {"ETag": '"v1"'}, None)
+    ]
+    client = make_client(server, tmp_path)
+    first = client.get("user")
+    second = client.get("user")
+
+    assert first.json() == second.json() == {"login": "octocat"}
+    assert second.from_cache
+    assert "If-None-Match" not in StubGitHub.requests[0]
+    assert StubGitHub.requests[1]["If-None-Match"] == '"v1"'
+    assert StubGitHub.requests[1]["Authorization"] == "token token"
+    assert client.stats()["hits"] == 1 and client.stats()["misses"] == 1
+
+def test_cached_etags_survive_a_new_client(server, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    StubGitHub.responses = [
+        (200, {"ETag": '"v1"'}, [{"number": 1}]),
+        (304, {}, None)
+    ]
+    make_client(server, tmp_path).get("repos/octocat/hello/issues", params={"state": "open"})
+    response = make_client(server, tmp_path).get("repos/octocat/hello/issues", params={"state": "open"})
+
+    assert response.json() == [{"number": 1}]
+    assert StubGitHub.requests[1]["If-None-Match"] == '"v1"'
+
+def test_cached_responses_are_not_shared_between_tokens(server, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    StubGitHub.responses = [(200, {"ETag": '"v1"'}, {"login": "octocat"})]
+    make_client(server, tmp_path, token="first").get("user")
+    make_client(server, tmp_path, token="second").get("user")
+
+    assert "If-None-Match" not in StubGitHub.requests[1]
+
+def test_rate_limited_requests_wait_for_the_reset(server, tmp_path, monkeypatch, sleeps):
+    monkeypatch.chdir(tmp_path)
+    reset = time.time() + 10
+    StubGitHub.responses = [
+        (403, {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": str(int(reset))}, {"message": "API rate limit exceeded"}),
+        (200, {"X-RateLimit-Remaining": "4999", "X-RateLimit-Reset": str(int(reset) + 3600)}, {"login": "octocat"})
+    ]
+    client = make_client(server, tmp_path)
+    response = client.get("user")
+
+    assert response.status_code == 200
+    assert len(StubGitHub.requests) == 2
+    # The 403 is retried once, after waiting until the reset
+    assert len(sleeps) == 1 and 8 <= sleeps[0] <= 12
+    assert client.stats()["rate_limit_remaining"] == 4999
+
+def test_retry_after_is_respected(server, tmp_path, monkeypatch, sleeps):
+    monkeypatch.chdir(tmp_path)
+    StubGitHub.responses = [
+        (429, {"Retry-After": "3"}, {"message": "secondary rate limit"}),
+        (200, {}, {"login": "octocat"})
+    ]
+    response = make_client(server, tmp_path).get("user")
+
+    assert response.status_code == 200
+    assert sleeps == [3.0]
+
+def test_waits_that_are_too_long_are_not_retried(server, tmp_path, monkeypatch, sleeps):
+    monkeypatch.chdir(tmp_path)
+    StubGitHub.responses = [(403, {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": str(int(time.time()) + 3600)}, {"message": "API rate limit exceeded"})]
+    response = make_client(server, tmp_path).get("user")
+
+    assert response.status_code == 403
+    assert len(StubGitHub.requests) == 1
+    assert sleeps == []
+
+def test_exhausted_limit_delays_the_next_request(server, tmp_path, monkeypatch, sleeps):
+    monkeypatch.chdir(tmp_path)
+    StubGitHub.responses = [(200, {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": str(int(time.time()) + 5)}, {"login": "octocat"})]
+    client = make_client(server, tmp_path)
+    client.get("user")
+    assert sleeps == []
+    client.get("user")
+
+    assert len(sleeps) == 1 and 3 <= sleeps[0] <= 7
+
+def test_shared_client_is_created_on_first_use(monkeypatch):
+    monkeypatch.setattr(client_module, "github_client", None)
+    client = client_module.get_github_client()
+    assert client_module.get_github_client() is client
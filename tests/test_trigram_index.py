@@ -0,0 +1,114 @@
+import itertools
+import random
+import re
+import pytest
+from agents.tools.fs import trigram_index
+from agents.tools.fs.trigram_index import TrigramIndex, fold_case, regex_trigrams, trigrams
+
+# Strings matching the patterns in different ways, with case and line variations
+TEXTS = [
+    "", "abc", "abcd", "xabcdx", "ABCD", "AbCd", "ab cd", "abd", "acd", "abbbcd", "abcabc",
+    "foo", "bar", "foobar", "barfoo", "FOO bar", "fooXbar", "foo-bar", "foo.bar", "foo\\bar",
+    "colour", "color", "colouur", "hello world", "HELLO WORLD", "helloworld", "hello  world",
+    "a+b", "a+b=c", "(abc)", "[abc]", "$100", "^start", "end$", "path/to/file.py", "path.to.file",
+    "this", "thıs", "THIS", "street", "ſtreet", "STREET", "μicro", "µicro", "ΣΑΣ", "σας", "ςας",
+]
+
+PATTERNS = [
+    # Literals and escapes
+    "abc", "abcd", "bcd", r"a\+b", r"\(abc\)", r"\[abc\]", r"\$100", r"\^start", r"end\$",
+    r"foo\.bar", r"foo\\bar", r"path/to/file\.py", "path.to.file",
+    # Alternation
+    "foo|bar", "(foo|bar)baz", "foo(bar|baz)", "(?:abc|abd)", "ab(c|d)d", "abc|", "x|abc",
+    # Optional groups and repeats
+    "colou?r", "colo(u)?r", "colo(?:u)?r", "hello( )?world", "ab(c)?d", "ab(cd)?", "(abc)?d",
+    "ab{0,3}cd", "abb{0,3}cd", "(abc){0,2}d", "(abc){1,2}", "(abc){2}", "ab*cd", "ab+cd", "ab*?cd",
+    "(foo)*bar", "(foo)+bar", "hello\\s*world", "hello\\s+world", "a.c", "a[bc]d", "a[^x]cd",
+    # Case insensitive
+    "(?i)abcd", "(?i)ABCD", "(?i)foo|bar", "(?i)hello world", "(?i)this", "(?i)street", "(?i)str",
+    "(?i)micro", "(?i)µicro", "(?i)σας", "(?i:abc)d", "a(?i:bcd)", "(?i)FOO bar",
+    # Anchors and lookarounds
+    "^abc", "abc$", "^foo|bar$", r"\babc", r"foo\b", "foo(?=bar)", "foo(?!bar)", "(?<=foo)bar",
+]
+
+def assert_superset(pattern, text):
+    if re.search(pattern, text):
+        assert regex_trigrams(pattern) <= trigrams(fold_case(text)), (pattern, text)
+
+@pytest.mark.parametrize("pattern", PATTERNS)
+def test_required_trigrams_are_in_every_match(pattern):
+    for text in TEXTS:
+        assert_superset(pattern, text)
+        assert_superset(pattern, f"prefix {text} suffix")
+
+def test_required_trigrams_on_generated_strings():
+    alphabet = "abcdAB ſı"
+    for pattern in PATTERNS:
+        for length in range(5):
+            for chars in itertools.product(alphabet, repeat=length):
+                assert_superset(pattern, "".join(chars))
+    rng = random.Random(0)
+    for _ in range(2000):
+        text = "".join(rng.choice(alphabet + "xyz") for _ in range(rng.randint(0, 12)))
+        for pattern in PATTERNS:
+            assert_superset(pattern, text)
+
+def test_literals_narrow_the_candidates():
+    assert regex_trigrams("abcd") == {"abc", "bcd"}
+    assert regex_trigrams("(?i)ABCD") == {"abc", "bcd"}
+    assert regex_trigrams(r"foo\.bar") == {"foo", "oo.", "o.b", ".ba", "bar"}
+    # Required parts around an optional or repeated part
+    assert regex_trigrams("hello( )?world") == {"hel", "ell", "llo", "wor", "orl", "rld"}
+    assert regex_trigrams("(abc){1,2}") == {"abc"}
+    # No run of three literals is required in every match
+    assert regex_trigrams("foo|bar") == set()
+    assert regex_trigrams("(abc){0,2}") == set()
+    assert regex_trigrams("a.c") == set()
+    assert regex_trigrams("(") == set()
+
+@pytest.fixture
+def tree(tmp_path):
+    root = tmp_path / "data"
+    (root / "sub").mkdir(parents=True)
+    (root / "a.txt").write_text("hello world\nfoo bar\n", encoding="utf-8")
+    (root / "b.md").write_text("HELLO WORLD\nſtreet\n", encoding="utf-8")
+    (root / "sub" / "c.py").write_text("def foo():\n    return 'bar'\n", encoding="utf-8")
+    (root / "d.bin").write_bytes(b"hello world")
+    return root
+
+def brute_force_grep(root, regex):
+    matches = []
+    for path in sorted(root.rglob("*")):
+        if path.is_file() and path.suffix != ".bin":
+            for number, line in enumerate(path.read_text(encoding="utf-8").split("\n"), start=1):
+                if re.search(regex, line):
+                    matches.append((str(path), number))
+    return matches
+
+@pytest.mark.parametrize("regex", ["hello world", "(?i)hello world", "(?i)street", "foo|bar", "return 'ba.'", "missing"])
+def test_grep_matches_a_scan_of_every_file(tree, tmp_path, regex):
+    index = TrigramIndex(str(tree), path=str(tmp_path / "index"))
+    index.update()
+    assert [(match["path"], match["line"]) for match in index.grep(regex)] == brute_force_grep(tree, regex)
+
+def test_update_picks_up_changes(tree, tmp_path):
+    index = TrigramIndex(str(tree), path=str(tmp_path / "index"))
+    index.update()
+    (tree / "a.txt").write_text("goodbye world\n", encoding="utf-8")
+    (tree / "sub" / "c.py").unlink()
+    index.update()
+    assert index.candidates("goodbye") == [str(tree / "a.txt")]
+    assert index.candidates("return") == []
+    # Loaded again from the saved index
+    assert TrigramIndex(str(tree), path=str(tmp_path / "index")).candidates("goodbye") == [str(tree / "a.txt")]
+
+def test_large_files_are_scanned(tree, tmp_path, monkeypatch):
+    monkeypatch.setattr(trigram_index, "MAX_FILE_BYTES", 30)
+    (tree / "large.txt").write_text("filler line\n" * 10 + "needle\n", encoding="utf-8")
+    index = TrigramIndex(str(tree), path=str(tmp_path / "index"))
+    index.update()
+    assert str(tree / "large.txt") in index.candidates("needle")
+    assert [(match["path"], match["line"]) for match in index.grep("needle")] == [(str(tree / "large.txt"), 11)]
+    (tree / "large.txt").unlink()
+    index.update()
+    assert index.candidates("needle") == []
@@ -1 +1,2 @@
-from .utils import vector_similarity, Logger
\ No newline at end of file
+from .utils import vector_similarity, Logger
+from .tracing import tracer, span, traced, current_span
\ No newline at end of file
@@ -0,0 +1,51 @@
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+# Base of the caches kept in a SQLite table (embeddings, chat completions, GitHub responses).
+# The database is opened on first use, so creating a cache does not touch the disk; without a
+# path there is no table. The most recent max_items entries are also kept in an in-memory LRU.
+# Subclasses read and write the LRU and the table under self.lock.
+class SQLiteCache:
+    def __init__(self, path, table, columns, max_items=0):
+        self.path = path
+        self.table = table
+        self.columns = columns
+        self.max_items = max_items
+        self.lock = threading.Lock()
+        self.items = OrderedDict()
+        self.db = None
+
+    def connect(self):
+        if self.db is None and self.path:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.db = sqlite3.connect(self.path, check_same_thread=False)
+            self.db.execute(f"CREATE TABLE IF NOT EXISTS {self.table} ({self.columns})")
+            self.db.commit()
+        return self.db
+
+    # Value of the key in the LRU, None when it is not there
+    def recall(self, key):
+        if key in self.items:
+            self.items.move_to_end(key)
+            return self.items[key]
+        return None
+
+    def remember(self, key, value):
+        if self.max_items <= 0:
+            return
+        self.items[key] = value
+        self.items.move_to_end(key)
+        while len(self.items) > self.max_items:
+            self.items.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+            db = self.connect()
+            if db is not None:
+                db.execute(f"DELETE FROM {self.table}")
+                db.commit()
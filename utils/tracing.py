@@ -0,0 +1,228 @@
+import atexit
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+
+active_span = contextvars.ContextVar("active_span", default=None)
+
+# Timed unit of work. Spans opened while another one is active (in the same thread, task, or a
+# context copied from it) become its children. Attributes hold the counters of the span, e.g.
+# token counts or the retries of an LLM call.
+class Span:
+    recording = True
+
+    def __init__(self, tracer, name, attributes):
+        parent = active_span.get()
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.thread = threading.current_thread().name
+        self.attributes = attributes
+        self.status = "ok"
+        self.error = None
+        self.start_time = None
+        self.end_time = None
+        self.token = None
+
+    def __enter__(self):
+        self.start_time = time.time_ns()
+        self.start = time.perf_counter()
+        self.token = active_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.duration = time.perf_counter() - self.start
+        self.end_time = self.start_time + int(self.duration * 1e9)
+        if exc_type is not None and exc_type is not GeneratorExit:
+            self.status = "error"
+            self.error = f"{exc_type.__name__}: {exc_value}"
+        try:
+            active_span.reset(self.token)
+        except ValueError:
+            # Closed from another context, e.g. a generator finalized elsewhere
+            pass
+        self.tracer.finish(self)
+        return False
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def set_attributes(self, **attributes):
+        self.attributes.update(attributes)
+
+    def increment(self, key, amount=1):
+        self.attributes[key] = self.attributes.get(key, 0) + amount
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "thread": self.thread,
+            "start_time": self.start_time / 1e9,
+            "duration": self.duration,
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes
+        }
+
+    # OTLP/JSON span, the format accepted by OpenTelemetry collectors
+    def to_otel(self):
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.start_time),
+            "endTimeUnixNano": str(self.end_time),
+            "attributes": [otel_attribute(key, value) for key, value in self.attributes.items()],
+            "status": {"code": 2, "message": self.error} if self.status == "error" else {"code": 1}
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+# Returned by a disabled tracer, so instrumented code costs one call and one attribute check
+class NoopSpan:
+    recording = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def set_attribute(self, key, value):
+        pass
+
+    def set_attributes(self, **attributes):
+        pass
+
+    def increment(self, key, amount=1):
+        pass
+
+NOOP_SPAN = NoopSpan()
+
+# Collects finished spans in memory (the last `max_spans`) for export. Disabled unless TRACING=1
+# or enable() is called.
+class Tracer:
+    def __init__(self, enabled=False, max_spans=10000, service_name="agents"):
+        self.enabled = enabled
+        self.service_name = service_name
+        self.spans = deque(maxlen=max_spans)
+        self.lock = threading.Lock()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def span(self, name, **attributes):
+        if not self.enabled:
+            return NOOP_SPAN
+        return Span(self, name, attributes)
+
+    def current_span(self):
+        return active_span.get() or NOOP_SPAN
+
+    def finish(self, span):
+        with self.lock:
+            self.spans.append(span)
+
+    def clear(self):
+        with self.lock:
+            self.spans.clear()
+
+    def finished_spans(self):
+        with self.lock:
+            return list(self.spans)
+
+    def export_json(self, path=None):
+        spans = [span.to_dict() for span in self.finished_spans()]
+        if path:
+            write_json(path, spans)
+        return spans
+
+    def export_otel(self, path=None):
+        data = {"resourceSpans": [{
+            "resource": {"attributes": [otel_attribute("service.name", self.service_name)]},
+            "scopeSpans": [{"scope": {"name": "agents.tracing"}, "spans": [span.to_otel() for span in self.finished_spans()]}]
+        }]}
+        if path:
+            write_json(path, data)
+        return data
+
+    # Count, total and mean duration per span name, plus the sum of their numeric attributes
+    def summary(self):
+        summary = defaultdict(lambda: {"count": 0, "total": 0.0})
+        for span in self.finished_spans():
+            entry = summary[span.name]
+            entry["count"] += 1
+            entry["total"] += span.duration
+            for key, value in span.attributes.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    entry[key] = entry.get(key, 0) + value
+        for entry in summary.values():
+            entry["mean"] = entry["total"] / entry["count"]
+        return dict(summary)
+
+tracer = Tracer(enabled=os.getenv("TRACING", "0").lower() in ("1", "true"))
+
+def span(name, **attributes):
+    return tracer.span(name, **attributes)
+
+def current_span():
+    return tracer.current_span()
+
+# Runs the function inside a span named `name`
+def traced(name):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return func(*args, **kwargs)
+            with tracer.span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+# For tenacity's before_sleep, counts the retries of the call on the active span
+def record_retry(retry_state):
+    current_span().increment("retries")
+
+def otel_attribute(key, value):
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    if isinstance(value, str):
+        return {"key": key, "value": {"stringValue": value}}
+    return {"key": key, "value": {"stringValue": json.dumps(value, default=str)}}
+
+def write_json(path, data):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(data, f, default=str)
+
+# TRACE_FILE exports the spans of the process on exit, as OTLP/JSON with TRACE_FORMAT=otel
+@atexit.register
+def export_trace_file():
+    path = os.getenv("TRACE_FILE")
+    if path and tracer.enabled:
+        if os.getenv("TRACE_FORMAT", "json") == "otel":
+            tracer.export_otel(path)
+        else:
+            tracer.export_json(path)
@@ -1,4 +1,9 @@
+import atexit
+import json
 import os
+import queue
+import threading
+import warnings
 from datetime import datetime
 from numpy import dot
 from numpy.linalg import norm
@@ -7,30 +12,127 @@ def vector_similarity(v1, v2):
     cos_sim = dot(v1, v2)/(norm(v1)*norm(v2))
     return cos_sim
 
+LEVELS = {"DEBUG": 10, "INFO": 20, "WARN": 30, "ERROR": 40}
+# Other names accepted in LOG_LEVEL
+LEVEL_ALIASES = {"WARNING": "WARN", "CRITICAL": "ERROR"}
+
+# Seconds flush() waits for the writer thread by default
+FLUSH_TIMEOUT = 5.0
+
+# Log file shared by every Logger created without an explicit log_file
+DEFAULT_LOG_FILE = f"log_{datetime.now().strftime('%Y%m%d%H%M%S')}.log"
+
+# Buffer of the log files, a batch of queued lines is written and flushed at once
+LOG_BUFFER_SIZE = 64 * 1024
+
+# Appends the lines queued by the loggers of one file from a background thread, so logging
+# never blocks the caller on file I/O. Lines queued together are written with a single flush.
+class LogWriter:
+    def __init__(self, path):
+        self.path = path
+        self.queue = queue.SimpleQueue()
+        self.thread = threading.Thread(target=self.run, name="log-writer", daemon=True)
+        self.thread.start()
+
+    def write(self, line):
+        self.queue.put(line)
+
+    def run(self):
+        with open(self.path, "a", encoding="utf-8", buffering=LOG_BUFFER_SIZE) as f:
+            while True:
+                items = [self.queue.get()]
+                while True:
+                    try:
+                        items.append(self.queue.get_nowait())
+                    except queue.Empty:
+                        break
+                f.writelines(item for item in items if isinstance(item, str))
+                f.flush()
+                for item in items:
+                    if isinstance(item, threading.Event):
+                        item.set()
+                if None in items:
+                    return
+
+    # Blocks until every line queued so far is on disk, False if that did not happen within the
+    # timeout or the writer thread is gone (e.g. the file could not be opened)
+    def flush(self, timeout=FLUSH_TIMEOUT):
+        if not self.thread.is_alive():
+            return False
+        written = threading.Event()
+        self.queue.put(written)
+        return written.wait(timeout)
+
+    def close(self, timeout=FLUSH_TIMEOUT):
+        self.queue.put(None)
+        self.thread.join(timeout)
+
+writers = {}
+writers_lock = threading.Lock()
+
+def get_log_writer(path):
+    path = os.path.abspath(path)
+    with writers_lock:
+        if path not in writers:
+            writers[path] = LogWriter(path)
+        return writers[path]
+
+@atexit.register
+def close_log_writers():
+    with writers_lock:
+        for writer in writers.values():
+            writer.close()
+        writers.clear()
+
+# Loggers writing to the same file share one LogWriter. Messages below `level` (LOG_LEVEL env,
+# INFO by default) are dropped; full prompts and responses are logged at DEBUG. Records are JSON
+# lines with the extra keyword fields of the call, or plain text lines with LOG_FORMAT=text.
+# verbose=True also prints the message, whatever the level.
 class Logger:
-    def __init__(self, log_file=None, log_dir='./logs'):
+    def __init__(self, log_file=None, log_dir='./logs', name=None, level=None, log_format=None):
         if not os.path.exists(log_dir):
-            os.makedirs(log_dir)
-        
-        if log_file is None:
-            timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-            log_file = f"log_{timestamp}.log"
-        
-        self.log_file = os.path.join(log_dir, log_file)
-
-    def _write_log(self, level, msg, verbose):
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        cleaned_msg = msg.encode('utf-8').decode('ascii', 'ignore')
-        with open(self.log_file, "a") as f:
-            f.write(f"{timestamp} [{level}] {cleaned_msg}\n")
+            os.makedirs(log_dir, exist_ok=True)
+
+        self.log_file = os.path.join(log_dir, log_file or DEFAULT_LOG_FILE)
+        self.name = name
+        self.level = LEVELS[parse_level(level or os.getenv("LOG_LEVEL", "INFO"))]
+        self.log_format = log_format or os.getenv("LOG_FORMAT", "json")
+        self.writer = get_log_writer(self.log_file)
+
+    def enabled(self, level):
+        return LEVELS[level] >= self.level
+
+    def _write_log(self, level, msg, verbose, **fields):
+        now = datetime.now()
+        if self.enabled(level):
+            if self.log_format == "json":
+                record = {"timestamp": now.isoformat(timespec="milliseconds"), "level": level, "logger": self.name, "message": msg, **fields}
+                self.writer.write(json.dumps(record, default=str) + "\n")
+            else:
+                cleaned_msg = msg.encode('utf-8').decode('ascii', 'ignore')
+                extra = "".join(f" {key}={value}" for key, value in fields.items())
+                self.writer.write(f"{now.strftime('%Y-%m-%d %H:%M:%S')} [{level}] {cleaned_msg}{extra}\n")
         if verbose:
-            print(f"{timestamp} [{level}] {msg}\n".strip())
+            print(f"{now.strftime('%Y-%m-%d %H:%M:%S')} [{level}] {msg}\n".strip())
+
+    def debug(self, msg, verbose=False, **fields):
+        self._write_log("DEBUG", msg, verbose, **fields)
+
+    def info(self, msg, verbose=False, **fields):
+        self._write_log("INFO", msg, verbose, **fields)
+
+    def warn(self, msg, verbose=False, **fields):
+        self._write_log("WARN", msg, verbose, **fields)
 
-    def info(self, msg, verbose=False):
-        self._write_log("INFO", msg, verbose)
+    def error(self, msg, verbose=True, **fields):
+        self._write_log("ERROR", msg, verbose, **fields)
 
-    def warn(self, msg, verbose=False):
-        self._write_log("WARN", msg, verbose)
+    def flush(self, timeout=FLUSH_TIMEOUT):
+        return self.writer.flush(timeout)
 
-    def error(self, msg, verbose=True):
-        self._write_log("ERROR", msg, verbose)
\ No newline at end of file
+def parse_level(level):
+    name = LEVEL_ALIASES.get(level.upper(), level.upper())
+    if name not in LEVELS:
+        warnings.warn(f"Unknown log level '{level}', using INFO. Valid levels are {list(LEVELS)}")
+        return "INFO"
+    return name